@@ -0,0 +1,246 @@
+from array import array
+import mmap
+import os
+import struct
+
+# Binary account store: one file holding every account and its transaction history.
+#
+#   header         64 bytes  (HEADER)
+#   account table  account_capacity fixed-width records (ACCOUNT_RECORD), one slot per account
+#   history blocks one contiguous block per account, located by the record's history offset
+#
+# A history block with room for c transactions is stored column by column so each column can be
+# copied straight into an array or viewed in place through the memory map:
+#   amounts (c int64 cents), timestamps (c int64 epoch seconds), balances (c int64 cents), types (c int8)
+# The record's history count says how many of those c rows are used. New transactions are written into
+# the spare rows in place; a block that is full is moved to the end of the file with twice the room,
+# and the bytes it leaves behind are counted as dead until the store is rewritten (see needs_compaction).
+STORE_MAGIC = b"BANKSTOR"
+STORE_VERSION = 1
+HEADER = struct.Struct("<8sIIIQQ")  # magic, version, account count, account capacity, end of data offset, dead bytes
+HEADER_SIZE = 64
+ACCOUNT_RECORD = struct.Struct("<8s64sqqqqqqQQQ")
+ACCOUNT_NAME_SIZE = 64
+HISTORY_COLUMNS = ("amounts", "timestamps", "balances", "types")
+MIN_HISTORY_CAPACITY = 8  # Rows given to a history block when it is moved to make room
+COMPACTION_MIN_BYTES = 1 << 20  # Dead bytes tolerated before needs_compaction asks for a rewrite
+
+# Field positions in an account record tuple
+(FIELD_NUMBER, FIELD_NAME, FIELD_INITIAL, FIELD_CURRENT, FIELD_DEPOSITED, FIELD_WITHDRAWN,
+ FIELD_DEPOSIT_COUNT, FIELD_WITHDRAWAL_COUNT, FIELD_HISTORY_OFFSET, FIELD_HISTORY_COUNT,
+ FIELD_HISTORY_CAPACITY) = range(11)
+
+def history_block_size(count):
+    # Size in bytes of a history block with room for count transactions
+    return count * 25
+
+def grown_capacity(count):
+    # Room to give a history block of count transactions when it has to be moved
+    return max(2 * count, MIN_HISTORY_CAPACITY)
+
+def encode_history_block(types, amounts, timestamps, balances, capacity=None):
+    # Serialize transaction columns into a history block, with each column padded to capacity rows
+    padding = (capacity or len(types)) - len(types)
+    return (amounts.tobytes() + bytes(padding * 8) + timestamps.tobytes() + bytes(padding * 8) +
+            balances.tobytes() + bytes(padding * 8) + types.tobytes() + bytes(padding))
+
+class AccountStore:
+    # Read access to an account store through mmap, plus in-place incremental updates
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.file = None
+        self.map = None
+        self.account_count = 0
+        self.account_capacity = 0
+        self.end_offset = 0
+        self.dead_bytes = 0  # Bytes of history blocks that were moved and are no longer referenced
+
+    def open(self):
+        # Map the store file and read its header
+        self.file = open(self.file_path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.account_count, self.account_capacity, self.end_offset, self.dead_bytes = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError(f"{self.file_path} is not a version {STORE_VERSION} account store.")
+        return self
+
+    def close(self):
+        # Unmap and close the store file
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __len__(self):
+        return self.account_count
+
+    def read_account(self, slot):
+        # Read the account record in the given slot as a tuple (see the FIELD_* positions)
+        fields = list(ACCOUNT_RECORD.unpack_from(self.map, HEADER_SIZE + slot * ACCOUNT_RECORD.size))
+        fields[FIELD_NUMBER] = fields[FIELD_NUMBER].decode("ascii")
+        fields[FIELD_NAME] = fields[FIELD_NAME].rstrip(b"\0").decode("utf-8")
+        return tuple(fields)
+
+    def history_location(self, slot):
+        # Return (offset, count, capacity) of an account's history block
+        return struct.unpack_from("<QQQ", self.map, HEADER_SIZE + (slot + 1) * ACCOUNT_RECORD.size - 24)
+
+    def history_column(self, slot, column):
+        # Return a zero-copy memoryview over one history column of an account, indexable like a list
+        offset, count, capacity = self.history_location(slot)
+        start = offset + HISTORY_COLUMNS.index(column) * capacity * 8
+        if column == "types":
+            return memoryview(self.map)[start:start + count].cast("b")
+        return memoryview(self.map)[start:start + count * 8].cast("q")
+
+    def history_view(self, slot):
+        # Return a HistoryView reading an account's history in place, without copying it out of the map
+        return HistoryView(*(self.history_column(slot, column) for column in ("types", "amounts", "timestamps", "balances")))
+
+    def read_history(self, slot):
+        # Copy an account's transaction history out of the map as (types, amounts, timestamps, balances) arrays
+        columns = {}
+        for column in HISTORY_COLUMNS:
+            view = self.history_column(slot, column)
+            columns[column] = array(view.format, view.tobytes())
+            view.release()
+        return columns["types"], columns["amounts"], columns["timestamps"], columns["balances"]
+
+    def raw_history_block(self, slot):
+        # Return an account's history block as bytes without its spare rows, without decoding it
+        offset, count, capacity = self.history_location(slot)
+        if count == capacity:
+            return self.map[offset:offset + history_block_size(count)]
+        return b"".join(self.map[offset + index * capacity * 8:offset + index * capacity * 8 + count * 8]
+                        for index in range(3)) + self.map[offset + 24 * capacity:offset + 24 * capacity + count]
+
+    def needs_compaction(self):
+        # Check whether enough space is taken by moved history blocks that the store should be rewritten
+        return self.dead_bytes > COMPACTION_MIN_BYTES and self.dead_bytes * 2 > self.end_offset
+
+    def update_accounts(self, updates, new_accounts):
+        # Write changed accounts in place: updates is a list of (slot, fields, history or None) and
+        # new_accounts a list of (fields, history), where a history has types, amounts, timestamps and
+        # balances columns. Only the transactions beyond those already in the store are written, into the
+        # spare rows of the account's history block; a block without room for them is written again at
+        # the end of the file with room to grow. Then the fixed-width account records are rewritten.
+        # Returns the slots given to the new accounts, or None if the account table is full.
+        if self.account_count + len(new_accounts) > self.account_capacity:
+            return None
+        new_slots = list(range(self.account_count, self.account_count + len(new_accounts)))
+        pending = list(updates) + [(slot, fields, history) for slot, (fields, history) in zip(new_slots, new_accounts)]
+        end_offset = self.end_offset
+        dead_bytes = self.dead_bytes
+        writes = []  # (file offset, bytes) of history data
+        records = []
+        for slot, fields, history in pending:
+            fields = list(fields)
+            if history is None:
+                fields[FIELD_HISTORY_OFFSET], fields[FIELD_HISTORY_COUNT], fields[FIELD_HISTORY_CAPACITY] = \
+                    self.history_location(slot)
+            else:
+                offset, count, capacity = self.history_location(slot) if slot < self.account_count else (0, 0, 0)
+                new_count = len(history)
+                if count <= new_count <= capacity:
+                    columns = (history.amounts, history.timestamps, history.balances)
+                    for index, column in enumerate(columns):
+                        writes.append((offset + index * capacity * 8 + count * 8, column[count:new_count].tobytes()))
+                    writes.append((offset + 24 * capacity + count, history.types[count:new_count].tobytes()))
+                else:
+                    dead_bytes += history_block_size(capacity)
+                    offset, capacity = end_offset, grown_capacity(new_count)
+                    block = encode_history_block(history.types, history.amounts, history.timestamps, history.balances,
+                                                 capacity)
+                    writes.append((offset, block))
+                    end_offset += len(block)
+                fields[FIELD_HISTORY_OFFSET], fields[FIELD_HISTORY_COUNT], fields[FIELD_HISTORY_CAPACITY] = \
+                    offset, new_count, capacity
+            records.append((slot, pack_account_record(fields)))
+
+        self.map.close()
+        self.map = None
+        try:
+            # Write the history data first, so a crash never leaves a record counting rows that are not there
+            for offset, data in writes:
+                self.file.seek(offset)
+                self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            for slot, record in records:
+                self.file.seek(HEADER_SIZE + slot * ACCOUNT_RECORD.size)
+                self.file.write(record)
+            self.account_count += len(new_accounts)
+            self.end_offset = end_offset
+            self.dead_bytes = dead_bytes
+            self.file.seek(0)
+            self.file.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, self.account_count, self.account_capacity,
+                                        self.end_offset, self.dead_bytes))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        finally:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return new_slots
+
+class HistoryView:
+    # Read-only column view of one account's history inside the memory map, with the same types, amounts,
+    # timestamps and balances attributes as an in-memory history. Must be closed before the store is updated.
+    def __init__(self, types, amounts, timestamps, balances):
+        self.types = types
+        self.amounts = amounts
+        self.timestamps = timestamps
+        self.balances = balances
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        return (self.types[index], self.amounts[index], self.timestamps[index], self.balances[index])
+
+    def close(self):
+        for view in (self.types, self.amounts, self.timestamps, self.balances):
+            view.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def pack_account_record(fields):
+    # Serialize an account record tuple (see the FIELD_* positions)
+    fields = list(fields)
+    fields[FIELD_NUMBER] = fields[FIELD_NUMBER].encode("ascii")
+    name = fields[FIELD_NAME].encode("utf-8")
+    if len(name) > ACCOUNT_NAME_SIZE:
+        raise ValueError(f"Account holder name longer than {ACCOUNT_NAME_SIZE} bytes: {fields[FIELD_NAME]}")
+    fields[FIELD_NAME] = name
+    return ACCOUNT_RECORD.pack(*fields)
+
+def write_store(file_path, accounts, account_count, spare_capacity=1024):
+    # Write a complete store holding account_count accounts from an iterable of (fields, history block)
+    # pairs, each block holding exactly the record's history count with no spare rows. The pairs are
+    # consumed one at a time, so history blocks never all need to be in memory.
+    capacity = account_count + spare_capacity  # Leave room for accounts created before the next full rewrite
+    with open(file_path, "wb") as file:
+        end_offset = HEADER_SIZE + capacity * ACCOUNT_RECORD.size
+        records = []
+        file.seek(end_offset)
+        for fields, block in accounts:
+            fields = list(fields)
+            fields[FIELD_HISTORY_OFFSET] = end_offset
+            fields[FIELD_HISTORY_CAPACITY] = fields[FIELD_HISTORY_COUNT]
+            file.write(block)
+            end_offset += len(block)
+            records.append(pack_account_record(fields))
+        if len(records) != account_count:
+            raise ValueError(f"Expected {account_count} accounts but got {len(records)}.")
+        file.seek(0)
+        file.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, account_count, capacity, end_offset, 0).ljust(HEADER_SIZE, b"\0"))
+        file.write(b"".join(records))
+        file.flush()
+        os.fsync(file.fileno())
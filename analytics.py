@@ -0,0 +1,317 @@
+import argparse
+from datetime import date, datetime
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from account_store import HISTORY_COLUMNS
+from bank_management import DEPOSIT, WITHDRAWAL, format_transaction, iter_history_file, open_bank
+from money import format_money
+
+# Bank-wide analytics over every transaction at once. The transactions of all accounts are loaded into
+# one set of NumPy columns, account by account, so each account's transactions form a contiguous segment
+# in time order. Totals are computed with vectorized group-bys and cumulative sums over those columns,
+# always in int64 cents so they stay exact.
+
+# Shift that packs an account id above a timestamp in one int64 sort key (timestamps stay below 2**34)
+ACCOUNT_KEY_SHIFT = 34
+
+class BankColumns:
+    # Columnar copy of a bank's accounts and transactions.
+    # Account arrays are indexed by account id (the account's position in bank.accounts); transaction
+    # arrays hold every transaction, with account id's transactions at offsets[id]:offsets[id + 1].
+    def __init__(self, accounts, offsets, account_ids, types, amounts, timestamps, balances):
+        self.account_numbers = [account.account_number for account in accounts]
+        self.account_holder_names = [account.account_holder_name for account in accounts]
+        self.initial_funds = np.array([account.initial_funds_cents for account in accounts], dtype=np.int64)
+        self.current_funds = np.array([account.current_funds_cents for account in accounts], dtype=np.int64)
+        self.offsets = offsets  # int64, one more than the number of accounts
+        self.account_ids = account_ids  # int32 account id of each transaction
+        self.types = types  # int8 DEPOSIT or WITHDRAWAL
+        self.amounts = amounts  # int64 cents
+        self.timestamps = timestamps  # int64 epoch seconds
+        self.balances = balances  # int64 cents, the account balance after the transaction
+
+    def __len__(self):
+        return len(self.types)
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Bank analytics need NumPy. Install it with: pip install numpy")
+
+def load_columns(bank):
+    # Load the transactions of every account into a BankColumns. Histories in memory are copied
+    # straight from their arrays, unloaded ones from the binary store's memory map or the text
+    # history files, without loading them into the accounts.
+    require_numpy()
+    accounts = bank.accounts
+    counts = np.array([len(account.transaction_history) if account.is_history_loaded() else account.saved_transaction_count
+                       for account in accounts], dtype=np.int64)
+    total = int(counts.sum())
+    types = np.empty(total, dtype=np.int8)
+    amounts = np.empty(total, dtype=np.int64)
+    timestamps = np.empty(total, dtype=np.int64)
+    balances = np.empty(total, dtype=np.int64)
+    position = 0
+    for index, account in enumerate(accounts):
+        if account.is_history_loaded():
+            history = account.transaction_history
+            count = len(history)
+            end = position + count
+            types[position:end] = np.frombuffer(history.types, dtype=np.int8)
+            amounts[position:end] = np.frombuffer(history.amounts, dtype=np.int64)
+            timestamps[position:end] = np.frombuffer(history.timestamps, dtype=np.int64)
+            balances[position:end] = np.frombuffer(history.balances, dtype=np.int64)
+        elif bank.store is not None and account.store_slot is not None:
+            offset, count, capacity = bank.store.history_location(account.store_slot)
+            end = position + count
+            for column, target in zip(HISTORY_COLUMNS, (amounts, timestamps, balances)):
+                start = offset + HISTORY_COLUMNS.index(column) * capacity * 8
+                target[position:end] = np.frombuffer(bank.store.map, dtype=np.int64, count=count, offset=start)
+            types[position:end] = np.frombuffer(bank.store.map, dtype=np.int8, count=count, offset=offset + 3 * capacity * 8)
+        else:
+            records = np.array(list(iter_history_file(account)), dtype=np.int64).reshape(-1, 4)
+            count = len(records)  # May be short of the saved count if the file could not be read
+            end = position + count
+            types[position:end] = records[:, 0]
+            amounts[position:end] = records[:, 1]
+            timestamps[position:end] = records[:, 2]
+            balances[position:end] = records[:, 3]
+        counts[index] = count
+        position = end
+    offsets = np.zeros(len(accounts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    account_ids = np.repeat(np.arange(len(accounts), dtype=np.int32), counts)
+    return BankColumns(accounts, offsets, account_ids, types[:position], amounts[:position],
+                       timestamps[:position], balances[:position])
+
+def local_day_starts(first_date, last_date):
+    # Epoch seconds of local midnight for each day from first_date to last_date inclusive, plus the day
+    # after, so searchsorted maps a timestamp to its local calendar day even across daylight saving changes
+    days = range(first_date.toordinal(), last_date.toordinal() + 2)
+    return np.array([time.mktime(date.fromordinal(day).timetuple()) for day in days], dtype=np.int64)
+
+def month_range(year, month):
+    # Start and end (exclusive) of a calendar month in local epoch seconds
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (int(time.mktime(date(year, month, 1).timetuple())),
+            int(time.mktime(date(next_year, next_month, 1).timetuple())))
+
+def sum_by_group(group_ids, value_columns, group_count):
+    # Sum each array of values per group id (0 <= id < group_count) exactly in int64. np.bincount would
+    # sum in float64, so instead sort by group once and add each run of equal ids with np.add.reduceat.
+    # Sorting ids of 16 bits or fewer with a stable sort is a radix sort, linear in the number of values.
+    sums = [np.zeros(group_count, dtype=np.int64) for _ in value_columns]
+    if len(group_ids) == 0:
+        return sums
+    order = np.argsort(group_ids.astype(np.min_scalar_type(group_count)), kind="stable")
+    sorted_ids = group_ids[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_ids)) + 1))
+    for total, values in zip(sums, value_columns):
+        total[sorted_ids[starts]] = np.add.reduceat(values[order].astype(np.int64), starts)
+    return sums
+
+def daily_totals(columns, start_time=None, end_time=None):
+    # Bank-wide deposits and withdrawals per local calendar day, for transactions with
+    # start_time <= timestamp < end_time (either bound optional). Returns a list of
+    # (date, deposited cents, withdrawn cents, deposit count, withdrawal count) for each day with activity.
+    timestamps, types, amounts = columns.timestamps, columns.types, columns.amounts
+    if start_time is not None or end_time is not None:
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start_time is not None:
+            mask &= timestamps >= start_time
+        if end_time is not None:
+            mask &= timestamps < end_time
+        timestamps, types, amounts = timestamps[mask], types[mask], amounts[mask]
+    if len(timestamps) == 0:
+        return []
+    first_date = datetime.fromtimestamp(int(timestamps.min())).date()
+    day_starts = local_day_starts(first_date, datetime.fromtimestamp(int(timestamps.max())).date())
+    # Days are 24 hours give or take a daylight saving change, so dividing finds each timestamp's day to
+    # within one, which is then corrected against the actual local midnights
+    day_ids = np.clip((timestamps - day_starts[0]) // 86400, 0, len(day_starts) - 2)
+    day_ids -= timestamps < day_starts[day_ids]
+    day_ids += timestamps >= day_starts[day_ids + 1]
+    day_count = len(day_starts) - 1
+    is_deposit = types == DEPOSIT
+    is_withdrawal = types == WITHDRAWAL
+    deposited, withdrawn = sum_by_group(day_ids, (np.where(is_deposit, amounts, 0), np.where(is_withdrawal, amounts, 0)),
+                                        day_count)
+    deposits = np.bincount(day_ids[is_deposit], minlength=day_count)
+    withdrawals = np.bincount(day_ids[is_withdrawal], minlength=day_count)
+    return [(date.fromordinal(first_date.toordinal() + day), int(deposited[day]), int(withdrawn[day]),
+             int(deposits[day]), int(withdrawals[day]))
+            for day in np.flatnonzero(deposits + withdrawals)]
+
+def period_summary(columns, start_time=None, end_time=None):
+    # Per-account activity for start_time <= timestamp < end_time (either bound optional), as a dict of
+    # arrays indexed by account id: first and last transaction index ("start", "end"), "opening" and
+    # "closing" balance, "deposited" and "withdrawn" cents, and "deposits" and "withdrawals" counts.
+    # Each account's transactions are in time order, so the period is found in every account at once by
+    # binary search over (account id, timestamp) keys, and the totals come from cumulative sums.
+    account_starts = columns.offsets[:-1]
+    account_ends = columns.offsets[1:]
+    if start_time is None and end_time is None:
+        starts, ends = account_starts, account_ends
+    else:
+        keys = (columns.account_ids.astype(np.int64) << ACCOUNT_KEY_SHIFT) + columns.timestamps
+        account_keys = np.arange(len(account_starts), dtype=np.int64) << ACCOUNT_KEY_SHIFT
+        limit = (1 << ACCOUNT_KEY_SHIFT) - 1
+        starts = account_starts if start_time is None else np.searchsorted(keys, account_keys + min(max(start_time, 0), limit))
+        ends = account_ends if end_time is None else np.searchsorted(keys, account_keys + min(max(end_time, 0), limit))
+
+    # Balance after the transaction before each index, where index 0 has no transaction before it
+    balances_before = np.concatenate(([0], columns.balances))
+    is_deposit = columns.types == DEPOSIT
+    is_withdrawal = columns.types == WITHDRAWAL
+
+    def range_sums(values):
+        cumulative = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(values, out=cumulative[1:])
+        return cumulative[ends] - cumulative[starts]
+
+    return {
+        "start": starts,
+        "end": ends,
+        "opening": np.where(starts > account_starts, balances_before[starts], columns.initial_funds),
+        "closing": np.where(ends > account_starts, balances_before[ends], columns.initial_funds),
+        "deposited": range_sums(np.where(is_deposit, columns.amounts, 0)),
+        "withdrawn": range_sums(np.where(is_withdrawal, columns.amounts, 0)),
+        "deposits": range_sums(is_deposit.astype(np.int64)),
+        "withdrawals": range_sums(is_withdrawal.astype(np.int64)),
+    }
+
+def top_accounts(columns, count=10, by="balance", start_time=None, end_time=None):
+    # The count accounts with the highest current balance, or with the most money moved in and out
+    # (by="flow") between start_time and end_time. Returns a list of (account id, value in cents).
+    if by == "balance":
+        values = columns.current_funds
+    elif by == "flow":
+        summary = period_summary(columns, start_time, end_time)
+        values = summary["deposited"] + summary["withdrawn"]
+    else:
+        raise ValueError(f"Unknown ranking: {by}")
+    count = min(count, len(values))
+    if count <= 0:
+        return []
+    top = np.argpartition(values, len(values) - count)[len(values) - count:]  # Unordered top count in O(n)
+    top = top[np.argsort(values[top], kind="stable")[::-1]]
+    return [(int(account_id), int(values[account_id])) for account_id in top]
+
+def balance_percentiles(columns, percentiles=(0, 10, 25, 50, 75, 90, 99, 100)):
+    # Distribution of current balances across accounts, as a list of (percentile, balance in cents)
+    if len(columns.current_funds) == 0:
+        return []
+    values = np.percentile(columns.current_funds, percentiles, method="lower")  # Always an actual balance
+    return [(percentile, int(value)) for percentile, value in zip(percentiles, values)]
+
+def monthly_statements(columns, year, month, include_transactions=True, active_only=False):
+    # Yield a statement for each account for the given month: opening and closing balance, totals and
+    # optionally every transaction in the month. All accounts are summarized together up front; only the
+    # formatting is done per account.
+    start_time, end_time = month_range(year, month)
+    summary = period_summary(columns, start_time, end_time)
+    title = date(year, month, 1).strftime("%B %Y")
+    for account_id in range(len(columns.account_numbers)):
+        deposits = int(summary["deposits"][account_id])
+        withdrawals = int(summary["withdrawals"][account_id])
+        if active_only and not deposits + withdrawals:
+            continue
+        lines = [f"Statement for {title}",
+                 f"Account Number: {columns.account_numbers[account_id]}",
+                 f"Account Holder: {columns.account_holder_names[account_id]}",
+                 f"Opening Balance: {format_money(int(summary['opening'][account_id]))}",
+                 f"Total Deposited: {format_money(int(summary['deposited'][account_id]))} ({deposits} deposits)",
+                 f"Total Withdrawn: {format_money(int(summary['withdrawn'][account_id]))} ({withdrawals} withdrawals)",
+                 f"Closing Balance: {format_money(int(summary['closing'][account_id]))}"]
+        if include_transactions:
+            for index in range(int(summary["start"][account_id]), int(summary["end"][account_id])):
+                lines.append(format_transaction(int(columns.types[index]), int(columns.amounts[index]),
+                                                int(columns.timestamps[index]), int(columns.balances[index])))
+        yield "\n".join(lines) + "\n"
+
+def write_statements(columns, year, month, file_path, include_transactions=True, active_only=False):
+    # Write the monthly statements of every account to one file, separated by blank lines.
+    # Returns the number of statements written.
+    count = 0
+    with open(file_path, "w") as file:
+        for statement in monthly_statements(columns, year, month, include_transactions, active_only):
+            if count:
+                file.write("\n")
+            file.write(statement)
+            count += 1
+    return count
+
+def parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+def parse_month(text):
+    month = datetime.strptime(text, "%Y-%m")
+    return month.year, month.month
+
+def date_range(arguments):
+    # Convert --start and --end dates into an epoch second range, with the whole end date included
+    start_time = end_time = None
+    if arguments.start is not None:
+        start_time = int(time.mktime(arguments.start.timetuple()))
+    if arguments.end is not None:
+        end_time = int(local_day_starts(arguments.end, arguments.end)[1])
+    return start_time, end_time
+
+# Command line reports
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bank-wide analytics and monthly statements.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    daily_parser = commands.add_parser("daily", help="total deposits and withdrawals per day")
+    top_parser = commands.add_parser("top", help="accounts with the highest balance or flow")
+    top_parser.add_argument("--by", choices=["balance", "flow"], default="balance")
+    top_parser.add_argument("-n", "--count", type=int, default=10)
+    for command_parser in (daily_parser, top_parser):
+        command_parser.add_argument("--start", type=parse_date, help="first date (YYYY-MM-DD)")
+        command_parser.add_argument("--end", type=parse_date, help="last date (YYYY-MM-DD), included")
+    percentiles_parser = commands.add_parser("percentiles", help="distribution of account balances")
+    percentiles_parser.add_argument("--percentiles", type=float, nargs="+", default=[0, 10, 25, 50, 75, 90, 99, 100])
+    statements_parser = commands.add_parser("statements", help="write monthly statements for every account")
+    statements_parser.add_argument("month", type=parse_month, help="month (YYYY-MM)")
+    statements_parser.add_argument("--output", default=None, help="statements file (default statements_YYYY-MM.txt)")
+    statements_parser.add_argument("--summary-only", action="store_true", help="leave out the transaction lines")
+    statements_parser.add_argument("--active-only", action="store_true",
+                                   help="only accounts with transactions in the month")
+    arguments = parser.parse_args()
+
+    try:
+        require_numpy()
+    except ImportError as error:
+        print(error)
+        sys.exit(1)
+
+    bank = open_bank()
+    start = time.perf_counter()
+    columns = load_columns(bank)
+    print(f"Loaded {len(columns)} transactions of {len(bank.accounts)} accounts in {time.perf_counter() - start:.2f}s.")
+    start = time.perf_counter()
+
+    if arguments.command == "daily":
+        for day, deposited, withdrawn, deposits, withdrawals in daily_totals(columns, *date_range(arguments)):
+            print(f"{day}  Deposited: {format_money(deposited)} ({deposits})  Withdrawn: {format_money(withdrawn)} ({withdrawals})")
+    elif arguments.command == "top":
+        for rank, (account_id, value) in enumerate(top_accounts(columns, arguments.count, arguments.by,
+                                                                 *date_range(arguments)), 1):
+            print(f"{rank:>4}. {columns.account_numbers[account_id]}  {columns.account_holder_names[account_id]}  "
+                  f"{format_money(value)}")
+    elif arguments.command == "percentiles":
+        for percentile, value in balance_percentiles(columns, arguments.percentiles):
+            print(f"{percentile:>6g}th percentile: {format_money(value)}")
+    elif arguments.command == "statements":
+        year, month = arguments.month
+        file_path = arguments.output or f"statements_{year:04d}-{month:02d}.txt"
+        count = write_statements(columns, year, month, file_path, not arguments.summary_only, arguments.active_only)
+        print(f"Wrote {count} statements to {file_path}.")
+    print(f"Computed in {time.perf_counter() - start:.2f}s.")
+
+    # Nothing was changed; leave any journaled changes for the next checkpoint
+    bank.journal.close()
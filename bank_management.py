@@ -1,98 +1,326 @@
-from datetime import datetime
+import argparse
+from array import array
+import atexit
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import csv
+from datetime import datetime, timedelta
+import json
 import locale
 import os
-import re
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from account_store import (ACCOUNT_NAME_SIZE, AccountStore, encode_history_block, write_store, FIELD_NUMBER, FIELD_NAME, FIELD_INITIAL,
+                           FIELD_CURRENT, FIELD_DEPOSITED, FIELD_WITHDRAWN, FIELD_DEPOSIT_COUNT, FIELD_WITHDRAWAL_COUNT,
+                           FIELD_HISTORY_COUNT)
+from money import (FILE_ENCODING, MAX_CENTS, capture_locale, cents_to_text, format_file_money, format_money, parse_file_money,
+                   to_cents)
+from journal import Journal, RECORD_CREATE, RECORD_DEPOSIT, RECORD_WITHDRAWAL, RECORD_TRANSFER
 
 # Set the locale to the user's default locale
 locale.setlocale(locale.LC_ALL, '')
+capture_locale()
 
 def is_valid_account_number(account_number):
     # Check if the account number is valid (consists of 8 digits)
     return account_number.isdigit() and len(account_number) == 8
 
+def is_valid_account_holder_name(account_holder_name):
+    # Check that a holder name is not empty, has no commas (the account data file is comma separated)
+    # and fits in the binary store's fixed-width name field
+    return (bool(account_holder_name.strip()) and "," not in account_holder_name and
+            len(account_holder_name.encode("utf-8")) <= ACCOUNT_NAME_SIZE)
+
 def is_valid_transaction_amount(amount):
     # Check if the transaction amount is valid (a positive number)
     try:
-        amount = float(amount)
-        return amount > 0
+        return to_cents(amount) > 0
     except ValueError:
         return False
 
+# Transaction type codes stored in the transaction history
+DEPOSIT = 1
+WITHDRAWAL = 2
+TRANSACTION_TYPE_NAMES = {DEPOSIT: "Deposit", WITHDRAWAL: "Withdrawal"}
+TRANSACTION_TYPE_CODES = {name: code for code, name in TRANSACTION_TYPE_NAMES.items()}
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Write-ahead journal settings
+JOURNAL_FILE_NAME = "bank_journal.log"
+JOURNAL_SYNC_EVERY = 1  # Records per fsync; raise to group several records into one disk flush
+
+# Number of transactions shown at a time by the transaction history menu option
+HISTORY_PAGE_SIZE = 50
+
+# Binary account store used instead of the text files once it exists (see migrate_text_to_store)
+STORE_FILE_NAME = "account_data.store"
+
+# Files written when the program is started with --metrics or --profile
+METRICS_FILE_NAME = "bank_metrics.json"
+METRICS_DUMP_INTERVAL = 60  # Seconds between metrics dumps
+PROFILE_FILE_NAME = "bank_profile.prof"
+
+# Sharded persistence used instead of the text files once the folder exists (see migrate_text_to_shards).
+# Accounts are spread over SHARD_COUNT files that are read and written in parallel.
+SHARD_FOLDER_NAME = "Account Shards"
+SHARD_COUNT = 16
+SHARD_ENCODING = "utf-8"
+
+# Bounded-memory mode (see Bank.limit_history_memory): megabytes of transaction history kept in memory,
+# or None to keep every history that has been loaded
+HISTORY_MEMORY_MB = None
+
+# Folder holding the data files; None means the folder this file is in
+data_directory = None
+
+def format_transaction(transaction_type, amount_cents, timestamp, balance_cents, format_amount=format_money):
+    # Format a single transaction record as a display string. Amounts are formatted for the user's locale,
+    # or with format_amount=format_file_money for the fixed conventions of the transaction history files.
+    amount_formatted = format_amount(amount_cents)
+    balance_formatted = format_amount(balance_cents)
+    timestamp_formatted = datetime.fromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+    return f"{TRANSACTION_TYPE_NAMES[transaction_type]}: {amount_formatted} -- {timestamp_formatted} -- Current funds: {balance_formatted}"
+
+def parse_transaction(line):
+    # Parse a transaction history file line back into a (type, amount cents, timestamp, balance cents) record
+    try:
+        head, timestamp_text, balance_text = line.split(" -- ")
+        type_name, amount_text = head.split(": ", 1)
+        transaction_type = TRANSACTION_TYPE_CODES[type_name]
+        timestamp = int(datetime.strptime(timestamp_text, TIMESTAMP_FORMAT).timestamp())
+        return (transaction_type, parse_file_money(amount_text), timestamp,
+                parse_file_money(balance_text.partition(": ")[2]))
+    except (KeyError, ValueError):
+        return None
+
+# Binary form of one transaction record, used to checksum transaction histories
+HISTORY_ROW = struct.Struct("<bqqq")
+
+def history_checksum(history, start=0, checksum=0):
+    # CRC32 of the transaction records from index start onwards, continuing from a previous checksum
+    for index in range(start, len(history)):
+        checksum = zlib.crc32(HISTORY_ROW.pack(*history[index]), checksum)
+    return checksum
+
+class TransactionHistory:
+    # Columnar store of an account's transactions, one typed array per field.
+    # Records are kept as numbers and only formatted when displayed or exported.
+    __slots__ = ("types", "amounts", "timestamps", "balances")
+
+    def __init__(self):
+        self.types = array("b")  # DEPOSIT or WITHDRAWAL
+        self.amounts = array("q")  # Transaction amount in cents
+        self.timestamps = array("q")  # Epoch seconds
+        self.balances = array("q")  # Account balance after the transaction, in cents
+
+    @classmethod
+    def from_columns(cls, types, amounts, timestamps, balances):
+        # Build a history directly from already populated column arrays
+        history = cls()
+        history.types, history.amounts, history.timestamps, history.balances = types, amounts, timestamps, balances
+        return history
+
+    def append(self, transaction_type, amount_cents, timestamp, balance_cents):
+        # Append one transaction record. A value that does not fit its column raises OverflowError and
+        # leaves the history as it was.
+        count = len(self.types)
+        try:
+            self.types.append(transaction_type)
+            self.amounts.append(amount_cents)
+            self.timestamps.append(timestamp)
+            self.balances.append(balance_cents)
+        except OverflowError:
+            for column in (self.types, self.amounts, self.timestamps, self.balances):
+                del column[count:]
+            raise
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        # Return the record at the given index as a (type, amount cents, timestamp, balance cents) tuple
+        return (self.types[index], self.amounts[index], self.timestamps[index], self.balances[index])
+
+    def __iter__(self):
+        return zip(self.types, self.amounts, self.timestamps, self.balances)
+
+    def formatted(self, format_amount=format_money):
+        # Yield each transaction as a display string (see format_transaction)
+        for record in self:
+            yield format_transaction(*record, format_amount)
+
+def query_transactions(history, start_time=None, end_time=None, cursor=None, limit=50, newest_first=False):
+    # Return one page of transactions from a history (anything with types, amounts, timestamps and balances
+    # columns) as (records, next cursor). Only transactions with start_time <= timestamp < end_time (epoch
+    # seconds, either bound optional) are included. Transactions are appended as they happen, so the
+    # timestamps column is sorted and the range is found by binary search: O(log n + limit).
+    # The cursor is the history index to continue from; next cursor is None on the last page.
+    if limit < 1:
+        raise ValueError("The page limit must be at least 1.")  # An empty page would never advance the cursor
+    timestamps = history.timestamps
+    low = 0 if start_time is None else bisect_left(timestamps, start_time)
+    high = len(timestamps) if end_time is None else bisect_left(timestamps, end_time)
+    if newest_first:
+        stop = high if cursor is None else max(low, min(high, cursor))
+        begin = max(low, stop - limit)
+        records = [history[index] for index in range(stop - 1, begin - 1, -1)]
+        return records, (begin if begin > low else None)
+    begin = low if cursor is None else min(high, max(low, cursor))
+    stop = min(high, begin + limit)
+    records = [history[index] for index in range(begin, stop)]
+    return records, (stop if stop < high else None)
+
+def stream_transactions(records, start_time=None, end_time=None, cursor=None, limit=50, newest_first=False):
+    # Same as query_transactions, for a history that can only be read front to back (such as a history
+    # file that has not been loaded). Keeps at most limit records in memory.
+    if limit < 1:
+        raise ValueError("The page limit must be at least 1.")
+    if newest_first:
+        page = deque(maxlen=limit + 1)  # One extra record shows whether an older page exists
+        for index, record in enumerate(records):
+            if cursor is not None and index >= cursor:
+                break
+            if (start_time is None or record[2] >= start_time) and (end_time is None or record[2] < end_time):
+                page.append((index, record))
+        has_more = len(page) > limit
+        if has_more:
+            page.popleft()
+        page_records = [record for _, record in reversed(page)]
+        return page_records, (page[0][0] if has_more else None)
+    page_records = []
+    for index, record in enumerate(records):
+        if cursor is not None and index < cursor:
+            continue
+        if end_time is not None and record[2] >= end_time:
+            break
+        if start_time is not None and record[2] < start_time:
+            continue
+        if len(page_records) == limit:
+            return page_records, index
+        page_records.append(record)
+    return page_records, None
+
 class Account:
-    def __init__(self, account_number, account_holder_name, initial_funds):
+    # Slots keep the many accounts that are not in use small: without a history in memory an account
+    # holds only its number, name, balances and totals
+    __slots__ = ("account_number", "account_holder_name", "initial_funds_cents", "current_funds_cents",
+                 "_transaction_history", "history_loader", "store_slot", "total_deposited_cents",
+                 "total_withdrawn_cents", "deposit_count", "withdrawal_count", "saved_transaction_count",
+                 "history_checksum", "dirty", "history_cache")
+
+    def __init__(self, account_number, account_holder_name, initial_funds_cents):
         # Initialize Account object with account number, account holder name, initial funds and transaction histor
+        # All amounts are held as int numbers of cents
         self.account_number = account_number
         self.account_holder_name = account_holder_name
-        self.initial_funds = initial_funds
-        self.current_funds = initial_funds
-        self.transaction_history = []
-        # Format the initial funds using the user's locale
-        self.initial_funds_formatted = locale.currency(self.initial_funds, grouping=True, symbol=True)
-
-    def deposit(self, amount):
-        # Deposit the specified amount into the account
-        if is_valid_transaction_amount(amount):
-            self.current_funds += amount
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            deposit_amount_formatted = locale.currency(amount, grouping=True, symbol=True)
-            current_funds_formatted = locale.currency(self.current_funds, grouping=True, symbol=True)
-            self.transaction_history.append(
-                f"Deposit: {deposit_amount_formatted} -- {timestamp} -- Current funds: {current_funds_formatted}")
-
-    def withdraw(self, amount):
-        # Withdraw the specified amount from the account if sufficient funds are available
-        if is_valid_transaction_amount(amount) and amount <= self.current_funds:
-            self.current_funds -= amount
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            withdrawal_amount_formatted = locale.currency(amount, grouping=True, symbol=True)
-            current_funds_formatted = locale.currency(self.current_funds, grouping=True, symbol=True)
-            self.transaction_history.append(
-                f"Withdrawal: {withdrawal_amount_formatted} -- {timestamp} -- Current funds: {current_funds_formatted}")
+        self.initial_funds_cents = initial_funds_cents
+        self.current_funds_cents = initial_funds_cents
+        self._transaction_history = TransactionHistory()
+        self.history_loader = None  # Loads the transaction history on first access when it is kept on disk
+        self.store_slot = None  # Slot of the account in the binary account store, if it was loaded from one
+        # Running totals kept up to date by every recorded transaction
+        self.total_deposited_cents = 0
+        self.total_withdrawn_cents = 0
+        self.deposit_count = 0
+        self.withdrawal_count = 0
+        # Number of history records already written to the transaction history file, and their checksum
+        self.saved_transaction_count = 0
+        self.history_checksum = 0
+        self.dirty = True  # Changed since it was last saved; a new account has never been saved
+        self.history_cache = None  # HistoryCache that decides when the history is dropped from memory, if any
+
+    @property
+    def transaction_history(self):
+        # The account's TransactionHistory, read from disk on first access if it was loaded lazily
+        history = self._transaction_history
+        if history is None:
+            history = self._transaction_history = self.history_loader()
+            if self.history_cache is not None:
+                self.history_cache.loaded(self, history)
+        elif self.history_cache is not None:
+            self.history_cache.used(self, history)
+        return history
+
+    def set_history_loader(self, history_loader):
+        # Defer loading the transaction history until it is first accessed
+        self._transaction_history = None
+        self.history_loader = history_loader
+
+    def is_history_loaded(self):
+        # Check whether the transaction history is in memory
+        return self._transaction_history is not None
+
+    def deposit(self, amount_cents, timestamp=None):
+        # Deposit the specified number of cents into the account, unless the balance would no longer fit
+        # in the history's balance column. The balance only changes once the record has been appended.
+        if 0 < amount_cents <= MAX_CENTS - self.current_funds_cents:
+            if timestamp is None:
+                timestamp = int(time.time())
+            self.record_transaction(DEPOSIT, amount_cents, timestamp, self.current_funds_cents + amount_cents)
+            self.current_funds_cents += amount_cents
+            self.dirty = True
+            return True
+        return False
+
+    def withdraw(self, amount_cents, timestamp=None):
+        # Withdraw the specified number of cents from the account if sufficient funds are available
+        if 0 < amount_cents <= self.current_funds_cents:
+            if timestamp is None:
+                timestamp = int(time.time())
+            self.record_transaction(WITHDRAWAL, amount_cents, timestamp, self.current_funds_cents - amount_cents)
+            self.current_funds_cents -= amount_cents
+            self.dirty = True
+            return True
+        return False
+
+    def record_transaction(self, transaction_type, amount_cents, timestamp, balance_cents):
+        # Append a transaction record to the history and update the running totals
+        history = self.transaction_history
+        history.append(transaction_type, amount_cents, timestamp, balance_cents)
+        if self.history_cache is not None:
+            self.history_cache.grown(self, history)
+        if transaction_type == DEPOSIT:
+            self.total_deposited_cents += amount_cents
+            self.deposit_count += 1
+        elif transaction_type == WITHDRAWAL:
+            self.total_withdrawn_cents += amount_cents
+            self.withdrawal_count += 1
+
+    def query_history(self, start_time=None, end_time=None, cursor=None, limit=50, newest_first=False):
+        # Return a page of this account's transactions as (records, next cursor); see query_transactions
+        return query_transactions(self.transaction_history, start_time, end_time, cursor, limit, newest_first)
 
     def get_account_details(self):
         # Get a formatted string with account details including initial funds, current funds, total deposited, and total withdrawn
-        currency_symbol = locale.localeconv()['currency_symbol']  # Get the currency symbol based on the user's locale
-        
-        # Initialize variables to store the total deposited and total withdrawn amounts
-        total_deposited = 0.0
-        total_withdrawn = 0.0
-
-        # Iterate through the transaction history
-        for transaction in self.transaction_history:
-            if transaction.startswith('Deposit'):
-                # If the transaction is a deposit, extract the deposited amount and add it to the total deposited
-                match = re.search(r"{0}([\d,]+\.\d+)".format(currency_symbol), transaction)
-                if match:
-                    amount = float(match.group(1).replace(",", ""))
-                    total_deposited += amount
-            elif transaction.startswith('Withdrawal'):
-                # If the transaction is a withdrawal, extract the withdrawn amount and add it to the total withdrawn
-                match = re.search(r"{0}([\d,]+\.\d+)".format(currency_symbol), transaction)
-                if match:
-                    amount = float(match.group(1).replace(",", ""))
-                    total_withdrawn += amount
-
-        # Format the initial funds, current funds, total deposited, and total withdrawn using the user's locale
-        initial_funds_formatted = locale.currency(self.initial_funds, grouping=True, symbol=True)
-        current_funds_formatted = locale.currency(self.current_funds, grouping=True, symbol=True)
-        total_deposited_formatted = locale.currency(total_deposited, grouping=True, symbol=True)
-        total_withdrawn_formatted = locale.currency(total_withdrawn, grouping=True, symbol=True)
+        # Format the initial funds, current funds, total deposited, and total withdrawn using the user's locale.
+        # The totals are kept up to date as transactions are recorded, so the history is not scanned.
+        initial_funds_formatted = format_money(self.initial_funds_cents)
+        current_funds_formatted = format_money(self.current_funds_cents)
+        total_deposited_formatted = format_money(self.total_deposited_cents)
+        total_withdrawn_formatted = format_money(self.total_withdrawn_cents)
 
         # Return a formatted string with the account details
         return f"Account Number: {self.account_number}\nAccount Holder: {self.account_holder_name}\nInitial Funds: {initial_funds_formatted}\nCurrent Funds: {current_funds_formatted}\nTotal Deposited: {total_deposited_formatted}\nTotal Withdrawn: {total_withdrawn_formatted}"
 
     def save_transaction_history(self):
         # Save transaction history to a text file
-        folder = "Transaction History"  # Specify the folder to save the transaction history files
-        
         # Generate the file path for the current account's transaction history file
-        file_path = get_file_path(f"{self.account_number}_transaction_history.txt", folder)
+        file_path = get_history_file_path(self.account_number)
         try:
             # Create the folder if it doesn't exist
             os.makedirs(os.path.dirname(file_path), exist_ok=True)  # Create the folder if it doesn't exist
             # Write the transaction history to the file
-            with open(file_path, "w") as file:
-                file.write("\n".join(self.transaction_history))
+            with open(file_path, "w", encoding=FILE_ENCODING) as file:
+                file.write("\n".join(self.transaction_history.formatted(format_file_money)))
+            self.saved_transaction_count = len(self.transaction_history)
+            self.history_checksum = history_checksum(self.transaction_history)
+            self.dirty = False
             return True
         except FileNotFoundError:
             print("File not found while saving transaction history.")
@@ -101,27 +329,401 @@ class Account:
             print("Permission denied while saving transaction history.")
             return False
 
+    def save_new_transactions(self):
+        # Append only the transactions recorded since the last save to the transaction history file
+        if not self.is_history_loaded():
+            return True  # Everything was written when the history was dropped from memory
+        history = self.transaction_history
+        if self.saved_transaction_count == 0:
+            return self.save_transaction_history()  # Nothing on disk yet, so write the whole file
+        file_path = get_history_file_path(self.account_number)
+        try:
+            with open(file_path, "a", encoding=FILE_ENCODING) as file:
+                for index in range(self.saved_transaction_count, len(history)):
+                    file.write("\n" + format_transaction(*history[index], format_file_money))
+            self.history_checksum = history_checksum(history, self.saved_transaction_count, self.history_checksum)
+            self.saved_transaction_count = len(history)
+            self.dirty = False
+            return True
+        except FileNotFoundError:
+            print("File not found while saving transaction history.")
+            return False
+        except PermissionError:
+            print("Permission denied while saving transaction history.")
+            return False
+
+class HistoryCache:
+    # Least recently used set of the accounts whose transaction history is in memory. Once the histories
+    # hold more than max_bytes, the least recently used ones are handed to page_out, which writes their
+    # unsaved transactions to disk and drops them; they are read back on their next access.
+    # Meant for a bank used from one thread, as the menu, ingest and bank_service are.
+    # Hits and misses are counted once per operation on an account: Bank.find_account starts a new
+    # operation, and further accesses to the same history during it are not counted again.
+    def __init__(self, max_bytes, page_out):
+        self.max_transactions = max(1, max_bytes // HISTORY_ROW.size)
+        self.page_out = page_out
+        self.accounts = OrderedDict()  # Account -> [transactions held, operation last counted], least recently used first
+        # Entries of accounts that page_out had to keep in memory, left out of the LRU so evict does not
+        # try them again on every access. They rejoin it when used or after a checkpoint (see unpin).
+        self.pinned = {}
+        self.transaction_count = 0
+        self.operation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_backs = 0
+
+    def add(self, account, history):
+        # Track an account whose history is in memory as the most recently used, and return its entry
+        entry = self.accounts.get(account)
+        if entry is None:
+            entry = self.accounts[account] = self.pinned.pop(account, None) or [0, None]
+        else:
+            self.accounts.move_to_end(account)
+        size = len(history)
+        self.transaction_count += size - entry[0]
+        entry[0] = size
+        return entry
+
+    def used(self, account, history):
+        # An account's history was accessed while in memory. It may have grown since the last access,
+        # so make room again if it went over the limit.
+        entry = self.add(account, history)
+        if entry[1] != self.operation:
+            entry[1] = self.operation
+            self.hits += 1
+        if self.transaction_count > self.max_transactions:
+            self.evict()
+
+    def grown(self, account, history):
+        # A transaction was appended to an account's history in memory; count it and make room if needed
+        entry = self.accounts.get(account) or self.pinned.get(account)
+        if entry is None:
+            return
+        self.transaction_count += len(history) - entry[0]
+        entry[0] = len(history)
+        if self.transaction_count > self.max_transactions:
+            self.evict()
+
+    def loaded(self, account, history):
+        # An account's history was read from disk; make room for it
+        self.misses += 1
+        self.add(account, history)[1] = self.operation
+        self.evict()
+
+    def evict(self):
+        # Page out least recently used histories until they fit, always keeping the most recent one.
+        # A history that page_out has to keep in memory is pinned.
+        while self.transaction_count > self.max_transactions and len(self.accounts) > 1:
+            account, entry = self.accounts.popitem(last=False)
+            unsaved = account.saved_transaction_count < len(account._transaction_history)
+            account.history_cache = None  # Writing the history back must not count as using it
+            try:
+                paged_out = self.page_out(account)
+            finally:
+                account.history_cache = self
+            if paged_out:
+                self.transaction_count -= entry[0]
+                self.evictions += 1
+                self.write_backs += unsaved
+            else:
+                self.pinned[account] = entry
+
+    def unpin(self):
+        # Put the pinned accounts back at the least recently used end of the LRU, once a checkpoint may
+        # have made them evictable (a new account in the binary store gets its slot then), and make room
+        for account, entry in self.pinned.items():
+            self.accounts[account] = entry
+            self.accounts.move_to_end(account, last=False)
+        self.pinned.clear()
+        self.evict()
+
+    def clear(self):
+        # Forget every tracked account
+        self.accounts.clear()
+        self.pinned.clear()
+        self.transaction_count = 0
+
+    def stats(self):
+        # Hit and miss counts, and what is in memory now
+        accesses = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / accesses if accesses else 0.0,
+                "evictions": self.evictions, "write_backs": self.write_backs,
+                "accounts_in_memory": len(self.accounts) + len(self.pinned),
+                "transactions_in_memory": self.transaction_count,
+                "transaction_limit": self.max_transactions}
+
 class Bank:
-    # Initialize Bank object with an empty list of accounts
+    # Initialize Bank object with an empty list of accounts and empty lookup indexes
     def __init__(self):
         self.accounts = []
+        self.accounts_by_number = {}  # Account number -> Account, for O(1) lookups
+        self.accounts_by_name = {}  # Lower-cased holder name -> list of Accounts
+        # Write-ahead journal and the snapshot it is checkpointed into (see attach_journal)
+        self.journal = None
+        self.data_file_path = None
+        self.checkpoint_every = 0
+        self.changed_accounts = {}  # Account number -> Account changed since the last checkpoint
+        self.new_accounts = []  # Accounts created since the last checkpoint
+        self.save_changes = save_changes_to_file
+        self.store = None  # Open AccountStore when the bank was loaded from the binary store
+        self.history_cache = None  # HistoryCache bounding the histories in memory (see limit_history_memory)
 
-    def create_account(self, account_number, first_name, last_name, initial_balance):
-        # Create a new account and add it to the list of accounts
-        initial_balance = round(float(initial_balance), 2)  # Round the initial balance to 2 decimal places
-        account_holder_name = f"{first_name} {last_name}"
-        account = Account(account_number, account_holder_name, initial_balance)
-        self.accounts.append(account)  # Add the account to the list of accounts
+    def add_account(self, account):
+        # Add an existing Account object to the bank and its indexes
+        if account.account_number in self.accounts_by_number:
+            return False  # Reject duplicate account numbers
+        if self.history_cache is not None:
+            account.history_cache = self.history_cache
+            if account.is_history_loaded():
+                self.history_cache.add(account, account._transaction_history)
+                self.history_cache.evict()
+        self.accounts.append(account)
+        self.accounts_by_number[account.account_number] = account
+        self.accounts_by_name.setdefault(account.account_holder_name.lower(), []).append(account)
+        return True
+
+    def load_accounts(self, accounts):
+        # Replace the bank's accounts with the given list and rebuild the indexes
+        self.accounts = []
+        self.accounts_by_number = {}
+        self.accounts_by_name = {}
+        if self.history_cache is not None:
+            self.history_cache.clear()
+        for account in accounts:
+            if not self.add_account(account):
+                print(f"Duplicate account number {account.account_number} skipped.")
+        if self.history_cache is not None:
+            self.history_cache.evict()
+
+    def limit_history_memory(self, max_bytes):
+        # Keep at most about max_bytes of transaction history in memory. Histories are read from disk when
+        # they are used and the least recently used are written back and dropped to make room, so memory
+        # follows the accounts in use rather than every account touched since startup.
+        # Only histories kept in the text files or the binary store can be paged out; with account shards
+        # every history stays in memory (see page_out_history), so open_bank does not enable this for them.
+        self.history_cache = HistoryCache(max_bytes, self.page_out_history)
+        for account in self.accounts:
+            account.history_cache = self.history_cache
+            if account.is_history_loaded():
+                self.history_cache.add(account, account._transaction_history)
+        self.history_cache.evict()
+        return self.history_cache
+
+    def page_out_history(self, account):
+        # Write an account's unsaved transactions to disk and drop its history from memory, to be read back
+        # on its next access. Returns False if the history has to stay in memory.
+        if self.save_changes is save_changes_to_store and self.store is not None:
+            if account.store_slot is None:
+                return False  # A new account gets its slot at the next checkpoint
+            history = account.transaction_history
+            if account.saved_transaction_count < len(history):
+                try:
+                    self.store.update_accounts([(account.store_slot, account_store_fields(account), history)], [])
+                except (IOError, ValueError) as error:
+                    print(f"Error saving account store: {error}")
+                    return False
+                account.saved_transaction_count = len(history)
+            store = self.store
+            account.set_history_loader(lambda account=account: TransactionHistory.from_columns(*store.read_history(account.store_slot)))
+            return True
+        if self.save_changes is not save_changes_to_file:
+            return False
+        if not account.save_new_transactions():
+            return False
+        account.set_history_loader(lambda account=account: load_history_file(account))
+        return True
+
+    def create_account(self, account_number, first_name, last_name, initial_balance_cents):
+        # Create a new account with an initial balance in cents and add it to the list of accounts
+        account = self.open_account(account_number, f"{first_name} {last_name}", initial_balance_cents)
+        if account is None:
+            print("Account number already exists.")
+            return None
         print("Account created successfully.")
+        return account
 
-    def perform_transaction(self, account_number, amount, transaction_type):
-        # Perform a transaction (deposit/withdrawal) on an account
+    def open_account(self, account_number, account_holder_name, initial_balance_cents):
+        # Add and journal a new account, returning None if the account number is already taken.
+        # Raises ValueError for a holder name that could not be saved.
+        if not is_valid_account_holder_name(account_holder_name):
+            raise ValueError(f"Account holder name must be non-empty, contain no commas and be at most "
+                             f"{ACCOUNT_NAME_SIZE} bytes long.")
+        account = Account(account_number, account_holder_name, initial_balance_cents)
+        if not self.add_account(account):  # Add the account to the list of accounts
+            return None
+        self.new_accounts.append(account)
+        self.log_to_journal(RECORD_CREATE, int(time.time()), account_number, initial_balance_cents, account_holder_name)
+        return account
+
+    def perform_transaction(self, account_number, amount_cents, transaction_type):
+        # Perform a transaction (deposit/withdrawal) of amount_cents on an account
         account = self.find_account(account_number)
-        if account is not None:
-            if transaction_type == "deposit":
-                account.deposit(amount)
-            elif transaction_type == "withdrawal":
-                account.withdraw(amount)
+        if account is None:
+            return False
+        return self.post_transaction(account, amount_cents, transaction_type, int(time.time()))
+
+    def post_transaction(self, account, amount_cents, transaction_type, timestamp):
+        # Apply a deposit/withdrawal to an account that has already been looked up and journal it
+        if transaction_type == "deposit":
+            if not account.deposit(amount_cents, timestamp):
+                return False
+            record_type = RECORD_DEPOSIT
+        elif transaction_type == "withdrawal":
+            if not account.withdraw(amount_cents, timestamp):
+                return False
+            record_type = RECORD_WITHDRAWAL
+        else:
+            return False
+        self.changed_accounts[account.account_number] = account
+        self.log_to_journal(record_type, timestamp, account.account_number, amount_cents, len(account.transaction_history) - 1)
+        return True
+
+    def apply_batch(self, records):
+        # Apply a batch of transaction records in one pass. Each record is a dict with "type" (deposit,
+        # withdrawal or transfer), "account", "amount" and, for transfers, "recipient".
+        # Deposits and withdrawals are grouped by account so each account is looked up once; a transfer
+        # first flushes the groups collected before it, so the outcome is the same as applying the
+        # records in order. All journal records of the batch share one fsync.
+        # Returns the number of records applied and a list of (record index, reason) for rejected records.
+        rejects = []
+        applied = 0
+        groups = {}  # Account -> list of (record index, transaction type, amount cents)
+        timestamp = int(time.time())
+
+        def apply_groups():
+            applied_in_groups = 0
+            for account, transactions in groups.items():
+                for index, transaction_type, amount_cents in transactions:
+                    if self.post_transaction(account, amount_cents, transaction_type, timestamp):
+                        applied_in_groups += 1
+                    elif transaction_type == "deposit":
+                        rejects.append((index, "Balance limit exceeded."))
+                    else:
+                        rejects.append((index, "Insufficient funds."))
+            groups.clear()
+            return applied_in_groups
+
+        with self.journal.group_commit() if self.journal is not None else nullcontext():
+            for index, record in enumerate(records):
+                try:
+                    transaction_type, account, recipient_account, amount_cents = self.validate_batch_record(record)
+                except ValueError as error:
+                    rejects.append((index, str(error)))
+                    continue
+                if transaction_type != "transfer":
+                    groups.setdefault(account, []).append((index, transaction_type, amount_cents))
+                    continue
+                applied += apply_groups()
+                if self.transfer_funds(account.account_number, recipient_account.account_number, amount_cents):
+                    applied += 1
+                elif amount_cents > account.current_funds_cents:
+                    rejects.append((index, "Insufficient funds."))
+                else:
+                    rejects.append((index, "Balance limit exceeded."))
+            applied += apply_groups()
+        return applied, rejects
+
+    def validate_batch_record(self, record):
+        # Check a batch record and return (transaction type, account, recipient account or None, amount cents).
+        # Raises ValueError with the reason when the record is invalid.
+        if not isinstance(record, dict):
+            raise ValueError("Malformed record.")
+        transaction_type = str(record.get("type") or "").strip().lower()
+        if transaction_type not in ("deposit", "withdrawal", "transfer"):
+            raise ValueError("Invalid transaction type. Expected deposit, withdrawal or transfer.")
+        account_number = str(record.get("account") or "").strip()
+        if not is_valid_account_number(account_number):
+            raise ValueError("Invalid account number. Account number should be 8 digits.")
+        account = self.find_account(account_number)
+        if account is None:
+            raise ValueError(f"Account {account_number} not found.")
+        amount = record.get("amount")
+        try:
+            # JSON true and false are ints to Python, so would otherwise post 1.00 or 0.00
+            amount_cents = 0 if isinstance(amount, bool) else to_cents(amount)
+        except (ValueError, TypeError, ArithmeticError):
+            amount_cents = 0  # Anything that does not convert is rejected like a non-positive amount
+        if amount_cents <= 0:
+            raise ValueError("Invalid amount. Amount should be a positive number.")
+        recipient_account = None
+        if transaction_type == "transfer":
+            recipient_account_number = str(record.get("recipient") or "").strip()
+            if not is_valid_account_number(recipient_account_number):
+                raise ValueError("Invalid recipient account number. Account number should be 8 digits.")
+            recipient_account = self.find_account(recipient_account_number)
+            if recipient_account is None:
+                raise ValueError(f"Recipient account {recipient_account_number} not found.")
+            if recipient_account is account:
+                raise ValueError("Cannot transfer to the same account.")
+        return transaction_type, account, recipient_account, amount_cents
+
+    def transfer_funds(self, sender_account_number, recipient_account_number, amount_cents):
+        # Transfer amount_cents between two different accounts, recorded as a single journal entry
+        if sender_account_number == recipient_account_number:
+            return False
+        sender_account = self.find_account(sender_account_number)
+        recipient_account = self.find_account(recipient_account_number)
+        if sender_account is None or recipient_account is None:
+            return False
+        if not 0 < amount_cents <= sender_account.current_funds_cents:
+            return False
+        if amount_cents > MAX_CENTS - recipient_account.current_funds_cents:
+            return False  # Check before the withdrawal so a rejected deposit cannot lose the money
+        timestamp = int(time.time())
+        sender_account.withdraw(amount_cents, timestamp)
+        recipient_account.deposit(amount_cents, timestamp)
+        self.changed_accounts[sender_account_number] = sender_account
+        self.changed_accounts[recipient_account_number] = recipient_account
+        self.log_to_journal(RECORD_TRANSFER, timestamp, sender_account_number, recipient_account_number, amount_cents,
+                            len(sender_account.transaction_history) - 1, len(recipient_account.transaction_history) - 1)
+        return True
+
+    def attach_journal(self, journal, data_file_path, checkpoint_every=10000, save_changes=None):
+        # Replay the journal over the loaded snapshot, then log every change to it from now on.
+        # The journal is checkpointed into the snapshot after checkpoint_every records (0 disables this)
+        # using save_changes, which defaults to the text file format.
+        self.journal = None  # Do not re-log the records being replayed
+        replayed = replay_journal(self, journal)
+        journal.open()
+        self.journal = journal
+        self.data_file_path = data_file_path
+        self.checkpoint_every = checkpoint_every
+        self.save_changes = save_changes or save_changes_to_file
+        return replayed
+
+    def log_to_journal(self, record_type, *fields):
+        # Append a record to the journal, if one is attached, and checkpoint when it has grown large enough
+        if self.journal is None:
+            return
+        self.journal.append(record_type, *fields)
+        if self.checkpoint_every and self.journal.record_count >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # Compact the journal into the snapshot by saving only what changed, then truncate the journal
+        if self.journal is None:
+            return False
+        if not self.save_changes(self, self.data_file_path):
+            return False
+        self.journal.truncate()
+        if self.history_cache is not None:
+            self.history_cache.unpin()
+        return True
+
+    def query_history(self, account_number, start_time=None, end_time=None, cursor=None, limit=50, newest_first=False):
+        # Return a page of an account's transactions as (records, next cursor), or None if the account does
+        # not exist. A history that has not been loaded is read from disk without loading it: in place from
+        # the binary store, or streamed from the text history file.
+        account = self.find_account(account_number)
+        if account is None:
+            return None
+        if account.is_history_loaded():
+            return account.query_history(start_time, end_time, cursor, limit, newest_first)
+        if self.store is not None and account.store_slot is not None:
+            with self.store.history_view(account.store_slot) as history:
+                return query_transactions(history, start_time, end_time, cursor, limit, newest_first)
+        return stream_transactions(iter_history_file(account), start_time, end_time, cursor, limit, newest_first)
 
     def display_account_details(self, account_number):
         # Display account details
@@ -130,25 +732,165 @@ class Bank:
             return account.get_account_details()
 
     def generate_reports(self):
-        # Generate reports for all accounts
-        report = ""
+        # Generate reports for all accounts, yielding one account's details at a time
         for account in self.accounts:
-            report += account.get_account_details() + "\n"
-        return report
+            yield account.get_account_details() + "\n"
 
     def find_account(self, account_number):
         # Find an account by account number
-        for account in self.accounts:
-            if account.account_number == account_number:
-                return account
-        return None
+        if self.history_cache is not None:
+            self.history_cache.operation += 1  # Each lookup starts a new operation for the hit and miss counts
+        return self.accounts_by_number.get(account_number)
+
+    def find_accounts_by_name(self, account_holder_name):
+        # Find all accounts held by the given name (case-insensitive)
+        return list(self.accounts_by_name.get(account_holder_name.strip().lower(), []))
 
 def get_file_path(filename, folder=""):
-    # Get the file path of the specified file in the specified folder
-    current_file = os.path.abspath(__file__)
-    current_dir = os.path.dirname(current_file)
+    # Get the file path of the specified file in the specified folder of the data directory
+    current_dir = data_directory
+    if current_dir is None:
+        current_file = os.path.abspath(__file__)
+        current_dir = os.path.dirname(current_file)
     return os.path.join(current_dir, folder, filename)
 
+def get_history_file_path(account_number):
+    # Get the file path of an account's transaction history file
+    return get_file_path(f"{account_number}_transaction_history.txt", "Transaction History")
+
+def replay_journal(bank, journal):
+    # Re-apply journal records on top of the loaded snapshot. Transactions whose history index shows
+    # they are already in the snapshot (from an interrupted checkpoint) are skipped.
+    replayed = 0
+    for record_type, fields in journal.read_records():
+        try:
+            timestamp = int(fields[0])
+            if record_type == RECORD_CREATE:
+                account_number, initial_cents, account_holder_name = fields[1], int(fields[2]), fields[3]
+                if bank.find_account(account_number) is None:
+                    account = Account(account_number, account_holder_name, initial_cents)
+                    bank.add_account(account)
+                    bank.new_accounts.append(account)
+                    replayed += 1
+                continue
+            if record_type == RECORD_TRANSFER:
+                sender, recipient, amount_cents = fields[1], fields[2], int(fields[3])
+                legs = [(sender, WITHDRAWAL, int(fields[4])), (recipient, DEPOSIT, int(fields[5]))]
+            elif record_type in (RECORD_DEPOSIT, RECORD_WITHDRAWAL):
+                amount_cents = int(fields[2])
+                transaction_type = DEPOSIT if record_type == RECORD_DEPOSIT else WITHDRAWAL
+                legs = [(fields[1], transaction_type, int(fields[3]))]
+            else:
+                print(f"Unknown journal record type {record_type} skipped.")
+                continue
+        except (IndexError, ValueError):
+            print("Malformed journal record skipped.")
+            continue
+
+        for account_number, transaction_type, history_index in legs:
+            account = bank.find_account(account_number)
+            if account is None:
+                print(f"Journal record for unknown account {account_number} skipped.")
+                continue
+            if history_index < len(account.transaction_history):
+                continue  # Already in the snapshot
+            if transaction_type == DEPOSIT:
+                applied = account.deposit(amount_cents, timestamp)
+            else:
+                applied = account.withdraw(amount_cents, timestamp)
+            if not applied:
+                print(f"Journal record for account {account_number} could not be applied.")
+                continue
+            bank.changed_accounts[account_number] = account
+            replayed += 1
+    return replayed
+
+def read_history_file(account_number, limit=None):
+    # Read an account's transaction history file into a TransactionHistory, stopping after limit records.
+    # Also returns whether the file holds more records than that.
+    history = TransactionHistory()
+    with open(get_history_file_path(account_number), "r", encoding=FILE_ENCODING) as transaction_file:
+        for transaction in transaction_file:
+            record = parse_transaction(transaction.strip())
+            if record is None:
+                continue  # Skip blank or malformed lines
+            if limit is not None and len(history) == limit:
+                return history, True
+            history.append(*record)
+    return history, False
+
+def iter_history_file(account):
+    # Stream the saved records of an account's history file one at a time, without loading the file
+    try:
+        with open(get_history_file_path(account.account_number), "r", encoding=FILE_ENCODING) as transaction_file:
+            count = 0
+            for transaction in transaction_file:
+                if count == account.saved_transaction_count:
+                    return
+                record = parse_transaction(transaction.strip())
+                if record is not None:
+                    count += 1
+                    yield record
+    except FileNotFoundError:
+        print(f"Transaction history file not found for account {account.account_number}.")
+    except PermissionError:
+        print(f"Permission denied while loading transaction history for account {account.account_number}.")
+
+def load_history_file(account):
+    # Lazily load the part of an account's history file covered by the account data snapshot.
+    # Records beyond it come from an interrupted save and are re-applied from the journal.
+    try:
+        history, has_extra_records = read_history_file(account.account_number, account.saved_transaction_count)
+    except FileNotFoundError:
+        print(f"Transaction history file not found for account {account.account_number}.")
+        return TransactionHistory()
+    except PermissionError:
+        print(f"Permission denied while loading transaction history for account {account.account_number}.")
+        return TransactionHistory()
+    if has_extra_records or len(history) < account.saved_transaction_count:
+        account.saved_transaction_count = 0  # The file no longer matches the snapshot, so rewrite it on the next save
+    return history
+
+def account_data_line(account):
+    # Format an account's line in the account data file:
+    # number,name,initial funds,current funds,deposited cents,withdrawn cents,deposits,withdrawals,saved transactions,history checksum
+    account_data = [
+        account.account_number,
+        account.account_holder_name,
+        cents_to_text(account.initial_funds_cents),
+        cents_to_text(account.current_funds_cents),
+        str(account.total_deposited_cents),
+        str(account.total_withdrawn_cents),
+        str(account.deposit_count),
+        str(account.withdrawal_count),
+        str(account.saved_transaction_count),
+        str(account.history_checksum)
+    ]
+    return ",".join(account_data) + "\n"
+
+def account_from_data_line(account_data):
+    # Build an account from the fields of an account data line (see account_data_line)
+    account = Account(account_data[0], account_data[1], to_cents(account_data[2]))
+    account.current_funds_cents = to_cents(account_data[3])
+    account.total_deposited_cents = int(account_data[4])
+    account.total_withdrawn_cents = int(account_data[5])
+    account.deposit_count = int(account_data[6])
+    account.withdrawal_count = int(account_data[7])
+    account.saved_transaction_count = int(account_data[8])
+    account.history_checksum = int(account_data[9])
+    account.dirty = False
+    return account
+
+def write_account_data(accounts, file_path):
+    # Write the account data file to a temporary file and rename it into place
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w") as file:
+        for account in accounts:
+            file.write(account_data_line(account))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
 def load_data_from_file(file_path):
     # Load account data and transaction history from a text file
     accounts = []
@@ -156,28 +898,38 @@ def load_data_from_file(file_path):
         with open(file_path, "r") as file:
             for line in file:
                 account_data = line.strip().split(",")
+                if len(account_data) >= 10:
+                    # The snapshot already holds the balance and totals, so there is nothing to replay and
+                    # the transaction history is only read on first access
+                    account = account_from_data_line(account_data)
+                    account.set_history_loader(lambda account=account: load_history_file(account))
+                    accounts.append(account)
+                    continue
+
                 account_number = account_data[0]
                 account_holder_name = account_data[1]
-                balance = float(account_data[2])
-                account = Account(account_number, account_holder_name, balance)
+                balance_cents = to_cents(account_data[2])
+                account = Account(account_number, account_holder_name, balance_cents)
                 accounts.append(account)
 
+                # Older account data files only hold the initial funds, so replay the transaction history
                 # Load transaction history for the account
-                transaction_file_path = get_file_path(f"{account_number}_transaction_history.txt", "Transaction History")
+                transaction_file_path = get_history_file_path(account_number)
                 try:
-                    with open(transaction_file_path, "r") as transaction_file:
-                        transaction_history = transaction_file.readlines()
-                        account.transaction_history = [transaction.strip() for transaction in transaction_history]
-
-                    # Update current_funds based on transaction history
-                    for transaction in account.transaction_history:
-                        match = re.search(r"{0}([\d,]+\.\d+)".format(locale.localeconv()['currency_symbol']), transaction)
-                        if match:
-                            amount = float(match.group(1).replace(",", ""))
-                            if transaction.startswith('Deposit'):
-                                account.current_funds += amount
-                            elif transaction.startswith('Withdrawal'):
-                                account.current_funds -= amount
+                    with open(transaction_file_path, "r", encoding=FILE_ENCODING) as transaction_file:
+                        for transaction in transaction_file:
+                            record = parse_transaction(transaction.strip())
+                            if record is None:
+                                continue  # Skip blank or malformed lines
+                            account.record_transaction(*record)
+
+                            # Update current_funds_cents based on transaction history
+                            if record[0] == DEPOSIT:
+                                account.current_funds_cents += record[1]
+                            elif record[0] == WITHDRAWAL:
+                                account.current_funds_cents -= record[1]
+                    account.saved_transaction_count = len(account.transaction_history)
+                    account.history_checksum = history_checksum(account.transaction_history)
                 except FileNotFoundError:
                     print(f"Transaction history file not found for account {account_number}.")
                 except PermissionError:
@@ -193,22 +945,503 @@ def load_data_from_file(file_path):
 def save_data_to_file(accounts, file_path):
     # Save account data to a text file
     try:
-        with open(file_path, "w") as file:
-            for account in accounts:
-                account_data = [
-                    account.account_number,
-                    account.account_holder_name,
-                    str(account.initial_funds)
-                ]
-                file.write(",".join(account_data) + "\n")
-        
-        # Save transaction history for each account
+        # Save transaction history for each account whose history is in memory; histories that were
+        # never loaded are unchanged on disk
         for account in accounts:
-            account.save_transaction_history()
+            if account.is_history_loaded():
+                account.save_transaction_history()
+
+        # The account data is written last, so it only ever describes history that is on disk
+        write_account_data(accounts, file_path)
         print("Account data and transaction history saved successfully.")
     except IOError:
         print("Error saving account data.")
 
+def save_reports_to_file(bank, file_path):
+    # Stream the report for every account to a text file without building it in memory
+    try:
+        with open(file_path, "w") as file:
+            for report in bank.generate_reports():
+                file.write(report + "\n")
+        print("Reports saved successfully.")
+        return True
+    except IOError:
+        print("Error saving reports.")
+        return False
+
+def save_changes_to_file(bank, file_path):
+    # Save what changed since the last checkpoint: new transactions are appended to their history files,
+    # then the account data snapshot (balances and checksums) is rewritten
+    try:
+        for account in bank.new_accounts:
+            bank.changed_accounts[account.account_number] = account
+        for account in bank.changed_accounts.values():
+            if not account.save_new_transactions():
+                return False
+        write_account_data(bank.accounts, file_path)
+        bank.new_accounts = []
+        bank.changed_accounts = {}
+        return True
+    except IOError:
+        print("Error saving account data.")
+        return False
+
+def account_store_fields(account):
+    # Build the binary store record for an account (the history offset and capacity are filled in by the store)
+    return (account.account_number, account.account_holder_name, account.initial_funds_cents,
+            account.current_funds_cents, account.total_deposited_cents, account.total_withdrawn_cents,
+            account.deposit_count, account.withdrawal_count, 0, len(account.transaction_history), 0)
+
+def account_store_block(account):
+    # Serialize an account's in-memory transaction history into a store history block
+    history = account.transaction_history
+    return encode_history_block(history.types, history.amounts, history.timestamps, history.balances)
+
+def load_data_from_store(store):
+    # Load account data from an open AccountStore. Balances and totals come from the fixed-width
+    # account records; each transaction history is read from the memory map on first access.
+    accounts = []
+    for slot in range(len(store)):
+        fields = store.read_account(slot)
+        account = Account(fields[FIELD_NUMBER], fields[FIELD_NAME], fields[FIELD_INITIAL])
+        account.current_funds_cents = fields[FIELD_CURRENT]
+        account.total_deposited_cents = fields[FIELD_DEPOSITED]
+        account.total_withdrawn_cents = fields[FIELD_WITHDRAWN]
+        account.deposit_count = fields[FIELD_DEPOSIT_COUNT]
+        account.withdrawal_count = fields[FIELD_WITHDRAWAL_COUNT]
+        account.saved_transaction_count = fields[FIELD_HISTORY_COUNT]
+        account.store_slot = slot
+        account.dirty = False
+        account.set_history_loader(lambda account=account: TransactionHistory.from_columns(*store.read_history(account.store_slot)))
+        accounts.append(account)
+    print("Account data loaded successfully.")
+    return accounts
+
+def save_data_to_store(accounts, file_path, store=None):
+    # Write every account to a new binary store file and swap it into place. Histories that were never
+    # loaded are copied across from the current store as raw bytes.
+    def rows():
+        for account in accounts:
+            if account.is_history_loaded() or store is None:
+                yield account_store_fields(account), account_store_block(account)
+            else:
+                fields = list(store.read_account(account.store_slot))
+                fields[FIELD_HISTORY_COUNT] = account.saved_transaction_count
+                yield fields, store.raw_history_block(account.store_slot)
+
+    temp_path = file_path + ".tmp"
+    try:
+        write_store(temp_path, rows(), len(accounts))
+        if store is not None:
+            store.close()
+        os.replace(temp_path, file_path)
+        if store is not None:
+            store.open()
+    except (IOError, ValueError) as error:
+        print(f"Error saving account store: {error}")
+        return False
+    for slot, account in enumerate(accounts):
+        account.store_slot = slot
+        account.dirty = False
+        if account.is_history_loaded():
+            account.saved_transaction_count = len(account.transaction_history)
+    return True
+
+def save_changes_to_store(bank, file_path):
+    # Save only the accounts changed since the last checkpoint into the binary store, in place: only the
+    # transactions recorded since then are written. Falls back to a full rewrite when the store has no
+    # free slots for new accounts, or when moved history blocks have left too much of it unused.
+    new_accounts = [account for account in bank.new_accounts if account.store_slot is None]
+    # Changed accounts whose history is no longer in memory were written when it was dropped
+    updates = [(account.store_slot, account_store_fields(account), account.transaction_history)
+               for account in bank.changed_accounts.values()
+               if account.store_slot is not None and account.is_history_loaded()]
+    try:
+        new_slots = bank.store.update_accounts(updates, [(account_store_fields(account), account.transaction_history)
+                                                         for account in new_accounts])
+    except (IOError, ValueError) as error:
+        print(f"Error saving account store: {error}")
+        return False
+    if new_slots is None or bank.store.needs_compaction():
+        if not save_data_to_store(bank.accounts, file_path, bank.store):
+            return False
+    else:
+        for account, slot in zip(new_accounts, new_slots):
+            account.store_slot = slot
+        for account in list(bank.changed_accounts.values()) + new_accounts:
+            if account.is_history_loaded():
+                account.saved_transaction_count = len(account.transaction_history)
+            account.dirty = False
+    bank.new_accounts = []
+    bank.changed_accounts = {}
+    return True
+
+def migrate_text_to_store(data_file_path, store_file_path):
+    # One-shot migration from account_data.txt and the per-account history files to the binary store
+    bank = Bank()
+    bank.load_accounts(load_data_from_file(data_file_path))
+    journal = Journal(get_file_path(JOURNAL_FILE_NAME))
+    replayed = bank.attach_journal(journal, data_file_path, checkpoint_every=0)
+    if replayed:
+        print(f"Recovered {replayed} journaled changes.")
+    if not save_data_to_store(bank.accounts, store_file_path):
+        journal.close()
+        return False
+    journal.truncate()  # The journaled changes are now part of the store
+    journal.close()
+    print(f"Migrated {len(bank.accounts)} accounts to {store_file_path}.")
+    return True
+
+def shard_index(account_number, shard_count):
+    # Shard holding an account. A CRC rather than hash() keeps the assignment the same in every process.
+    return zlib.crc32(account_number.encode("ascii")) % shard_count
+
+def shard_file_name(index, shard_count):
+    return f"shard_{index:03d}_of_{shard_count:03d}.txt"
+
+def shard_file_names(directory):
+    # Names of the shard files in a shard directory
+    try:
+        return sorted(name for name in os.listdir(directory) if name.startswith("shard_") and name.endswith(".txt"))
+    except FileNotFoundError:
+        return []
+
+def run_on_pool(function, argument_lists, workers=None):
+    # Call function with each list of arguments on a process pool and return the results in order.
+    # A single call runs in this process, since starting a pool would cost more than it saves.
+    if len(argument_lists) <= 1 or workers == 1:
+        return [function(*arguments) for arguments in argument_lists]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(argument_lists))) as executor:
+        return list(executor.map(function, *zip(*argument_lists)))
+
+def write_shard(file_path, accounts):
+    # Write one shard file. Runs in a worker process; accounts is a list of (account data line up to the
+    # saved transaction count, then the types, amounts, timestamps and balances columns as bytes).
+    # The file is written to a temporary file and renamed into place, so a shard is never half written.
+    # Returns the history checksum of each account.
+    checksums = []
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding=SHARD_ENCODING) as file:
+        for account_line, types, amounts, timestamps, balances in accounts:
+            history = TransactionHistory.from_columns(array("b", types), array("q", amounts), array("q", timestamps),
+                                                      array("q", balances))
+            checksum = history_checksum(history)
+            file.write(f"{account_line},{len(history)},{checksum}\n")
+            for line in history.formatted(format_file_money):
+                file.write(line + "\n")
+            checksums.append(checksum)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+    return checksums
+
+def read_shard(file_path):
+    # Read one shard file. Runs in a worker process and returns a list of (account data fields, then the
+    # types, amounts, timestamps and balances columns as bytes). Each account's line (it starts with the
+    # account number) is followed by its transactions.
+    accounts = []
+    history = None
+    with open(file_path, "r", encoding=SHARD_ENCODING) as file:
+        for line in file:
+            line = line.rstrip("\n")
+            if line[:1].isdigit():
+                history = TransactionHistory()
+                accounts.append((line.split(","), history))
+                continue
+            record = parse_transaction(line)
+            if record is not None and history is not None:
+                history.append(*record)
+    return [(fields, history.types.tobytes(), history.amounts.tobytes(), history.timestamps.tobytes(),
+             history.balances.tobytes()) for fields, history in accounts]
+
+def load_data_from_shards(directory, workers=None):
+    # Load every account and its whole transaction history from the shard files in directory, reading and
+    # parsing the shards in parallel on a process pool
+    accounts = []
+    file_paths = [os.path.join(directory, name) for name in shard_file_names(directory)]
+    try:
+        shards = run_on_pool(read_shard, [(file_path,) for file_path in file_paths], workers)
+    except PermissionError:
+        print("Permission denied while loading account shards.")
+        return accounts
+    for shard in shards:
+        for fields, types, amounts, timestamps, balances in shard:
+            account = account_from_data_line(fields)
+            account._transaction_history = TransactionHistory.from_columns(array("b", types), array("q", amounts),
+                                                                           array("q", timestamps), array("q", balances))
+            if len(account.transaction_history) != account.saved_transaction_count:
+                print(f"Account {account.account_number}: {len(account.transaction_history)} transactions in its shard, "
+                      f"expected {account.saved_transaction_count}.")
+            accounts.append(account)
+    print("Account data loaded successfully.")
+    return accounts
+
+def save_data_to_shards(accounts, directory, shard_count=SHARD_COUNT, workers=None):
+    # Write the accounts to shard files in directory, partitioned by shard_index. Only shards holding a
+    # dirty account (or with no file yet) are rewritten, in parallel on a process pool. Changing the
+    # shard count rewrites every shard and removes the old files.
+    shards = [[] for _ in range(shard_count)]
+    for account in accounts:
+        shards[shard_index(account.account_number, shard_count)].append(account)
+    existing = set(shard_file_names(directory))
+    stale = [name for name in existing if not name.endswith(f"_of_{shard_count:03d}.txt")]
+    pending = [index for index, shard in enumerate(shards)
+               if stale or shard_file_name(index, shard_count) not in existing or any(account.dirty for account in shard)]
+    arguments = []
+    for index in pending:
+        shard_accounts = []
+        for account in shards[index]:
+            history = account.transaction_history
+            account_line = account_data_line(account).rsplit(",", 2)[0]  # The writer adds the count and checksum
+            shard_accounts.append((account_line, history.types.tobytes(), history.amounts.tobytes(),
+                                   history.timestamps.tobytes(), history.balances.tobytes()))
+        arguments.append((os.path.join(directory, shard_file_name(index, shard_count)), shard_accounts))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        results = run_on_pool(write_shard, arguments, workers)
+        for name in stale:
+            os.remove(os.path.join(directory, name))
+    except IOError as error:
+        print(f"Error saving account shards: {error}")
+        return False
+    for index, checksums in zip(pending, results):
+        for account, checksum in zip(shards[index], checksums):
+            account.saved_transaction_count = len(account.transaction_history)
+            account.history_checksum = checksum
+            account.dirty = False
+    return True
+
+def save_changes_to_shards(bank, directory):
+    # Save what changed since the last checkpoint by rewriting the shards that hold changed accounts
+    if not save_data_to_shards(bank.accounts, directory):
+        return False
+    bank.new_accounts = []
+    bank.changed_accounts = {}
+    return True
+
+def migrate_text_to_shards(data_file_path, directory):
+    # One-shot migration from account_data.txt and the per-account history files to shard files
+    bank = Bank()
+    bank.load_accounts(load_data_from_file(data_file_path))
+    journal = Journal(get_file_path(JOURNAL_FILE_NAME))
+    replayed = bank.attach_journal(journal, data_file_path, checkpoint_every=0)
+    if replayed:
+        print(f"Recovered {replayed} journaled changes.")
+    for account in bank.accounts:
+        account.dirty = True
+    if not save_data_to_shards(bank.accounts, directory):
+        journal.close()
+        return False
+    journal.truncate()  # The journaled changes are now part of the shards
+    journal.close()
+    print(f"Migrated {len(bank.accounts)} accounts to {SHARD_COUNT} shards in {directory}.")
+    return True
+
+def verify_history_files(snapshots):
+    # Replay the history files of a batch of accounts and compare them with their snapshot values.
+    # Runs in a worker process; snapshots is a list of
+    # (account number, initial cents, current cents, saved transaction count, history checksum).
+    mismatches = []
+    for account_number, initial_cents, current_cents, transaction_count, checksum in snapshots:
+        try:
+            history, _ = read_history_file(account_number, transaction_count)
+        except (FileNotFoundError, PermissionError):
+            if transaction_count:
+                mismatches.append(f"Account {account_number}: transaction history file could not be read.")
+            continue
+        balance_cents = initial_cents
+        for transaction_type, amount_cents, _, _ in history:
+            balance_cents += amount_cents if transaction_type == DEPOSIT else -amount_cents
+        if len(history) != transaction_count:
+            mismatches.append(f"Account {account_number}: {len(history)} transactions on disk, expected {transaction_count}.")
+        elif history_checksum(history) != checksum:
+            mismatches.append(f"Account {account_number}: transaction history checksum mismatch.")
+        elif balance_cents != current_cents:
+            mismatches.append(f"Account {account_number}: replayed balance {cents_to_text(balance_cents)} does not match {cents_to_text(current_cents)}.")
+    return mismatches
+
+def account_snapshots(accounts):
+    # Capture the snapshot values of each account that verify_history_files checks
+    return [(account.account_number, account.initial_funds_cents, account.current_funds_cents,
+             account.saved_transaction_count, account.history_checksum)
+            for account in accounts]
+
+def verify_accounts(snapshots, workers=None, batch_size=1000):
+    # Check account snapshots (see account_snapshots) against the history files using a process pool.
+    # Returns a list of mismatch descriptions.
+    batches = [snapshots[start:start + batch_size] for start in range(0, len(snapshots), batch_size)]
+    mismatches = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch_mismatches in executor.map(verify_history_files, batches):
+            mismatches.extend(batch_mismatches)
+    return mismatches
+
+def start_background_verification(accounts):
+    # Verify the loaded snapshot in a background thread and report any mismatches when done.
+    # The snapshot values are captured now, before any transaction can change them.
+    snapshots = account_snapshots(accounts)
+
+    def verify():
+        mismatches = verify_accounts(snapshots)
+        for mismatch in mismatches:
+            print(f"\nVerification: {mismatch}")
+        if not mismatches:
+            print(f"\nVerification: all {len(accounts)} accounts match their transaction history.")
+
+    thread = threading.Thread(target=verify, daemon=True)
+    thread.start()
+    return thread
+
+def read_batch_file(file_path):
+    # Stream (line number, record) pairs from a batch file. Files ending in .jsonl hold one JSON object
+    # per line; anything else is read as CSV with a header row of type,account,amount,recipient.
+    # Lines that cannot be parsed are yielded with a record of None.
+    with open(file_path, "r", newline="") as file:
+        if file_path.lower().endswith(".jsonl"):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+        else:
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+
+def ingest_file(bank, file_path, chunk_size=10000):
+    # Post every transaction in a batch file through Bank.apply_batch, a chunk at a time, and report
+    # each rejected record and the overall throughput. Returns (applied, rejected), or None if the file
+    # could not be read to the end; the summary still covers the records posted before that.
+    applied = 0
+    rejected = 0
+    completed = True
+    start_time = time.perf_counter()
+
+    def apply_chunk(chunk):
+        chunk_applied, rejects = bank.apply_batch([record for _, record in chunk])
+        for index, reason in rejects:
+            print(f"Line {chunk[index][0]}: {reason}")
+        return chunk_applied, len(rejects)
+
+    try:
+        chunk = []
+        for line_number, record in read_batch_file(file_path):
+            chunk.append((line_number, record))
+            if len(chunk) >= chunk_size:
+                chunk_applied, chunk_rejected = apply_chunk(chunk)
+                applied += chunk_applied
+                rejected += chunk_rejected
+                chunk = []
+        if chunk:
+            chunk_applied, chunk_rejected = apply_chunk(chunk)
+            applied += chunk_applied
+            rejected += chunk_rejected
+    except FileNotFoundError:
+        print(f"Batch file {file_path} not found.")
+        return None
+    except PermissionError:
+        print(f"Permission denied while reading batch file {file_path}.")
+        return None
+    except (csv.Error, UnicodeDecodeError) as error:
+        print(f"Stopped reading batch file {file_path}: {error}")
+        completed = False
+
+    elapsed = time.perf_counter() - start_time
+    total = applied + rejected
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Ingested {total} records in {elapsed:.2f}s ({rate:,.0f} records/s): {applied} applied, {rejected} rejected.")
+    return (applied, rejected) if completed else None
+
+def open_bank(verify=False, history_memory_mb=None):
+    # Load the bank from the binary store if it exists, otherwise from the account shards if they exist,
+    # otherwise from the text files, and attach the journal. history_memory_mb bounds the transaction
+    # history kept in memory (see Bank.limit_history_memory).
+    bank = Bank()
+    save_changes = save_changes_to_file
+    file_path = get_file_path(STORE_FILE_NAME)
+    shard_directory = get_file_path(SHARD_FOLDER_NAME)
+    if os.path.exists(file_path):
+        bank.store = AccountStore(file_path).open()
+        accounts = load_data_from_store(bank.store)
+        save_changes = save_changes_to_store
+    elif shard_file_names(shard_directory):
+        file_path = shard_directory
+        accounts = load_data_from_shards(shard_directory)
+        save_changes = save_changes_to_shards
+    else:
+        file_path = get_file_path("account_data.txt")
+        accounts = load_data_from_file(file_path)
+    # Set the save format first: it decides where histories are paged out to while the accounts are loaded
+    bank.save_changes = save_changes
+    if history_memory_mb is not None:
+        if save_changes is save_changes_to_shards:
+            print("Account shards keep every transaction history in memory; the history memory limit is ignored.")
+        else:
+            bank.limit_history_memory(int(history_memory_mb * 1000000))
+    bank.load_accounts(accounts)
+    if verify and save_changes is save_changes_to_file:
+        # Replay the transaction history files in the background to check the snapshot balances
+        start_background_verification(list(bank.accounts))
+    # Recover changes made since the last checkpoint and journal every change from now on
+    replayed = bank.attach_journal(Journal(get_file_path(JOURNAL_FILE_NAME), sync_every=JOURNAL_SYNC_EVERY), file_path,
+                                   save_changes=save_changes)
+    if replayed:
+        print(f"Recovered {replayed} journaled changes.")
+    return bank
+
+def close_bank(bank):
+    # Save account data and transaction history to files
+    if bank.journal is not None:
+        # Only the changes recorded in the journal need to be written
+        if bank.checkpoint():
+            print("Account data and transaction history saved successfully.")
+        bank.journal.close()
+    else:
+        save_data_to_file(bank.accounts, get_file_path("account_data.txt"))
+    if bank.history_cache is not None:
+        stats = bank.history_cache.stats()
+        print(f"History cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), "
+              f"{stats['evictions']} evictions, {stats['write_backs']} write-backs.")
+
+def prompt_date_range():
+    # Prompt for an optional start and end date and return them as a (start, end) epoch second range,
+    # where the end is exclusive so the whole end date is included
+    dates = []
+    for prompt in ("Enter start date (YYYY-MM-DD, blank for all): ", "Enter end date (YYYY-MM-DD, blank for all): "):
+        while True:
+            text = input(prompt).strip()
+            if not text:
+                dates.append(None)
+                break
+            try:
+                dates.append(datetime.strptime(text, "%Y-%m-%d"))
+                break
+            except ValueError:
+                print("Invalid date. Please use the format YYYY-MM-DD.")
+    start_date, end_date = dates
+    start_time = int(start_date.timestamp()) if start_date is not None else None
+    end_time = int((end_date + timedelta(days=1)).timestamp()) if end_date is not None else None
+    return start_time, end_time
+
+def enable_instrumentation(metrics):
+    # Record the latency and file I/O of the bank's operations and load/save paths in a metrics.Metrics
+    metrics.instrument(Bank, ["open_account", "perform_transaction", "post_transaction", "apply_batch", "transfer_funds",
+                              "checkpoint", "query_history", "display_account_details", "generate_reports",
+                              "find_account", "find_accounts_by_name"], "Bank.")
+    metrics.instrument(Account, ["deposit", "withdraw", "get_account_details", "save_transaction_history",
+                                 "save_new_transactions", "query_history"], "Account.")
+    metrics.instrument(Journal, ["append", "sync", "truncate"], "Journal.")
+    metrics.instrument(AccountStore, ["read_history", "update_accounts"], "AccountStore.")
+    metrics.instrument(globals(), ["load_data_from_file", "load_history_file", "read_history_file", "iter_history_file",
+                                   "write_account_data", "save_data_to_file", "save_changes_to_file",
+                                   "save_reports_to_file", "load_data_from_store", "save_data_to_store",
+                                   "save_changes_to_store", "load_data_from_shards", "save_data_to_shards",
+                                   "replay_journal", "ingest_file"])
+    metrics.count_file_io(globals())
+    metrics.count_file_io(vars(sys.modules[Journal.__module__]))
+
 def display_menu():
     # Display menu options
     print("---- Bank Management System Menu ----")
@@ -240,25 +1473,32 @@ def handle_user_input(option):
                 continue
             break
 
-        # Prompt the user to enter the first name        
-        first_name = ""
-        while not first_name.strip():
-            first_name = input("Enter first name: ")
-            if not first_name.strip():
-                print("First name cannot be empty.")
+        while True:
+            # Prompt the user to enter the first name
+            first_name = ""
+            while not first_name.strip():
+                first_name = input("Enter first name: ")
+                if not first_name.strip():
+                    print("First name cannot be empty.")
+
+            # Prompt the user to enter the last name
+            last_name = ""
+            while not last_name.strip():
+                last_name = input("Enter last name: ")
+                if not last_name.strip():
+                    print("Last name cannot be empty.")
 
-        # Prompt the user to enter the last name
-        last_name = ""
-        while not last_name.strip():
-            last_name = input("Enter last name: ")
-            if not last_name.strip():
-                print("Last name cannot be empty.")
+            # Check the full name can be saved
+            if is_valid_account_holder_name(f"{first_name} {last_name}"):
+                break
+            print(f"Invalid name. The full name should contain no commas and be at most {ACCOUNT_NAME_SIZE} bytes long.")
 
         # Prompt the user to enter the initial balance
         while True:
             try:
-                initial_balance = float(input("Enter initial balance: "))
-                if initial_balance >= 0:
+                # Convert the initial balance to cents, limiting it to 2 decimal places
+                initial_balance_cents = to_cents(input("Enter initial balance: "))
+                if initial_balance_cents >= 0:
                     break
                 else:
                     print("Invalid initial balance. Initial balance should be a positive number.")
@@ -266,7 +1506,7 @@ def handle_user_input(option):
                 print("Invalid initial balance. Initial balance should be a valid number.")
 
         # Create an account with the provided input values
-        bank.create_account(account_number, first_name, last_name, initial_balance)
+        bank.create_account(account_number, first_name, last_name, initial_balance_cents)
 
     elif option == "2":
         # Prompt the user to enter an account number
@@ -293,10 +1533,9 @@ def handle_user_input(option):
         # Prompt the user to enter the transaction amount
         while True:
             try:
-                amount = float(input("Enter transaction amount: "))
-                if is_valid_transaction_amount(amount):
-                    # Limit the number of decimal places to 2
-                    amount = round(amount, 2)
+                # Convert the amount to cents, limiting it to 2 decimal places
+                amount_cents = to_cents(input("Enter transaction amount: "))
+                if amount_cents > 0:
                     break
                 else:
                     print("Invalid amount. Amount should be a positive number.")
@@ -305,20 +1544,22 @@ def handle_user_input(option):
 
         if transaction_type == "deposit":
             # Perform a deposit on the account
-            account.deposit(amount)
-            print(f"Success! {locale.currency(amount, grouping=True, symbol=True)} deposited to:")
-            print(f"Account Number: {account.account_number}")
-            print(f"Account Holder: {account.account_holder_name}")
-            print(f"Current Funds: {locale.currency(account.current_funds, grouping=True, symbol=True)}")
+            if bank.perform_transaction(account.account_number, amount_cents, "deposit"):
+                print(f"Success! {format_money(amount_cents)} deposited to:")
+                print(f"Account Number: {account.account_number}")
+                print(f"Account Holder: {account.account_holder_name}")
+                print(f"Current Funds: {format_money(account.current_funds_cents)}")
+            else:
+                print("Balance limit exceeded. The deposit would take the balance above the maximum.")
 
         elif transaction_type == "withdrawal":
             # Perform a withdrawal from the account
-            if amount <= account.current_funds:
-                account.withdraw(amount)
-                print(f"Success! {locale.currency(amount, grouping=True, symbol=True)} withdrawn from:")
+            if amount_cents <= account.current_funds_cents:
+                bank.perform_transaction(account.account_number, amount_cents, "withdrawal")
+                print(f"Success! {format_money(amount_cents)} withdrawn from:")
                 print(f"Account Number: {account.account_number}")
                 print(f"Account Holder: {account.account_holder_name}")
-                print(f"Current Funds: {locale.currency(account.current_funds, grouping=True, symbol=True)}")
+                print(f"Current Funds: {format_money(account.current_funds_cents)}")
             else:
                 print("Insufficient funds. Withdrawal amount exceeds the current balance.")
 
@@ -342,7 +1583,9 @@ def handle_user_input(option):
             if is_valid_account_number(recipient_account_number):
                 # Find the recipient's account with the provided account number
                 recipient_account = bank.find_account(recipient_account_number)
-                if recipient_account is not None:
+                if recipient_account is sender_account:
+                    print("Recipient account must be different from the sender account.")
+                elif recipient_account is not None:
                     break
                 else:
                     print("Recipient account not found. Please enter a valid account number.")
@@ -353,21 +1596,21 @@ def handle_user_input(option):
         while True:
             while True:
                 try:
-                    amount = float(input("Enter transfer amount: "))
-                    if is_valid_transaction_amount(amount):
-                        # Limit the number of decimal places to 2
-                        amount = round(amount, 2)
+                    # Convert the amount to cents, limiting it to 2 decimal places
+                    amount_cents = to_cents(input("Enter transfer amount: "))
+                    if amount_cents > 0:
                         break
                     else:
                         print("Invalid amount. Amount should be a positive number.")
                 except ValueError:
                     print("Invalid amount. Amount should be a valid number.")
 
-            if amount <= sender_account.current_funds:
+            if amount_cents <= sender_account.current_funds_cents:
                 # Perform the transfer by withdrawing from the sender's account and depositing to the recipient's account
-                sender_account.withdraw(amount)
-                recipient_account.deposit(amount)
-                print(f"Success! {locale.currency(amount, grouping=True, symbol=True)} transferred from:")
+                if not bank.transfer_funds(sender_account.account_number, recipient_account.account_number, amount_cents):
+                    print("Balance limit exceeded. The transfer would take the recipient's balance above the maximum.")
+                    break
+                print(f"Success! {format_money(amount_cents)} transferred from:")
                 print(f"Sender Account Number: {sender_account.account_number}")
                 print(f"Sender Account Holder: {sender_account.account_holder_name}")
                 print(f"To:")
@@ -397,10 +1640,18 @@ def handle_user_input(option):
                 # Find the account with the provided account number
                 account = bank.find_account(account_number)
                 if account is not None:
+                    # Optionally limit the history to a date range
+                    start_time, end_time = prompt_date_range()
                     print("\nTransaction History:")
-                    # Display each transaction in the account's transaction history
-                    for transaction in account.transaction_history:
-                        print(transaction)
+                    # Display the matching transactions a page at a time
+                    cursor = None
+                    while True:
+                        records, cursor = bank.query_history(account_number, start_time, end_time, cursor,
+                                                             HISTORY_PAGE_SIZE)
+                        for record in records:
+                            print(format_transaction(*record))
+                        if cursor is None or input("Press Enter for more transactions, or q to stop: ").lower() == "q":
+                            break
                     break
                 else:
                     print("Account not found. Please enter a valid account number.")
@@ -409,12 +1660,12 @@ def handle_user_input(option):
 
     elif option == "6":
         # Generate and display reports for all accounts
-        reports = bank.generate_reports()
-        print(reports)
+        for report in bank.generate_reports():
+            print(report)
 
     elif option == "7":
         # Save account data and transaction history to files and exit the program
-        save_data_to_file(bank.accounts, get_file_path("account_data.txt"))
+        close_bank(bank)
         exit()
 
     else:
@@ -422,12 +1673,52 @@ def handle_user_input(option):
 
 # Main program
 if __name__ == "__main__":
-    # Create a Bank object
-    bank = Bank()
-    # Load the account data from a file
-    file_path = get_file_path("account_data.txt")
-    accounts = load_data_from_file(file_path)
-    bank.accounts = accounts
+    parser = argparse.ArgumentParser(description="Bank management system. Starts the interactive menu unless a command is given.")
+    parser.add_argument("command", nargs="?", choices=["migrate", "shard", "ingest"],
+                        help="migrate: convert the text files to the binary store; shard: convert them to account "
+                             "shards; ingest: post the transactions in a batch file")
+    parser.add_argument("batch_file", nargs="?", help="CSV or JSON Lines file for ingest")
+    parser.add_argument("--verify", action="store_true", help="check the snapshot against the history files in the background")
+    parser.add_argument("--metrics", action="store_true", help=f"record operation metrics to {METRICS_FILE_NAME}")
+    parser.add_argument("--profile", action="store_true", help=f"profile the session into {PROFILE_FILE_NAME}")
+    parser.add_argument("--history-memory-mb", type=float, default=HISTORY_MEMORY_MB,
+                        help="keep only this many megabytes of transaction history in memory")
+    arguments = parser.parse_args()
+    if (arguments.command == "ingest") != (arguments.batch_file is not None):
+        parser.error("a batch file is needed by ingest, and only by ingest")
+
+    if arguments.metrics:
+        # Record operation counts, latencies and file I/O, dump them to a JSON file every
+        # METRICS_DUMP_INTERVAL seconds and print a summary on exit
+        from metrics import Metrics
+        session_metrics = Metrics()
+        enable_instrumentation(session_metrics)
+        session_metrics.start_dump_thread(get_file_path(METRICS_FILE_NAME), METRICS_DUMP_INTERVAL)
+        atexit.register(lambda: print(session_metrics.report()))
+    if arguments.profile:
+        # Profile the whole session and print the hottest functions on exit
+        from metrics import start_profiling
+        start_profiling(get_file_path(PROFILE_FILE_NAME))
+
+    if arguments.command == "migrate":
+        # Convert the text data files into the binary account store and exit
+        migrated = migrate_text_to_store(get_file_path("account_data.txt"), get_file_path(STORE_FILE_NAME))
+        sys.exit(0 if migrated else 1)
+
+    if arguments.command == "shard":
+        # Convert the text data files into account shards and exit
+        migrated = migrate_text_to_shards(get_file_path("account_data.txt"), get_file_path(SHARD_FOLDER_NAME))
+        sys.exit(0 if migrated else 1)
+
+    if arguments.command == "ingest":
+        # Post the deposits, withdrawals and transfers in a CSV or JSON Lines file, then save and exit
+        bank = open_bank(history_memory_mb=arguments.history_memory_mb)
+        result = ingest_file(bank, arguments.batch_file)
+        close_bank(bank)
+        sys.exit(0 if result is not None else 1)
+
+    # Create a Bank object and load the account data
+    bank = open_bank(verify=arguments.verify, history_memory_mb=arguments.history_memory_mb)
 
     while True:
         # Display the menu
@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+from collections import deque
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from account_store import ACCOUNT_NAME_SIZE
+from bank_management import (HISTORY_PAGE_SIZE, TRANSACTION_TYPE_NAMES, close_bank, is_valid_account_holder_name,
+                             is_valid_account_number, open_bank)
+from money import cents_to_text, to_cents
+from transaction_engine import build_stress_bank
+
+# Network front end for the Bank. Clients send one JSON object per line and get one JSON object per
+# line back, in the same order, over a connection that stays open for as many requests as they like.
+# A client may send many requests without waiting for the answers (pipelining).
+#
+#   {"id": 1, "op": "create_account", "account": "00000004", "name": "Ada Lovelace", "initial": "100.00"}
+#   {"id": 2, "op": "deposit", "account": "00000004", "amount": "25.50"}
+#   {"id": 3, "op": "withdraw", "account": "00000004", "amount": "5"}
+#   {"id": 4, "op": "transfer", "account": "00000004", "recipient": "00000001", "amount": "10"}
+#   {"id": 5, "op": "details", "account": "00000004"}
+#   {"id": 6, "op": "history", "account": "00000004", "limit": 50}
+#
+# History requests return the newest transactions first. They may also give "start" and "end" epoch
+# seconds (end exclusive) and the "cursor" returned by the previous page to continue from.
+# Responses are {"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}.
+# A response to a request that changed an account is only sent once its journal record is on disk.
+# Requests are executed one at a time on the event loop, and journal records from all connections
+# are synced together by a single background flush, so one fsync covers many requests.
+DEFAULT_PORT = 8765
+
+class RequestError(Exception):
+    pass
+
+class BankService:
+    def __init__(self, bank):
+        self.bank = bank
+        self.journal = bank.journal
+        self.durable_count = 0  # Journal records known to be on disk
+        self.flush_requested = None
+        self.durable_changed = None
+
+    async def serve(self, host, port):
+        # Accept connections until cancelled
+        self.flush_requested = asyncio.Event()
+        self.durable_changed = asyncio.Condition()
+        if self.journal is not None:
+            self.durable_count = self.journal.written_count
+        flusher = asyncio.create_task(self.flush_journal())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Bank service listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+
+    async def handle_connection(self, reader, writer):
+        # Execute requests as soon as they arrive and hand the responses to a sender task, which writes
+        # them in order once they are durable
+        responses = asyncio.Queue()
+        sender = asyncio.create_task(self.send_responses(responses, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = self.execute_line(line)
+                await responses.put((response, self.journal.written_count if self.journal is not None else 0))
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            await responses.put(None)
+            await sender
+            writer.close()
+
+    async def send_responses(self, responses, writer):
+        try:
+            while True:
+                item = await responses.get()
+                if item is None:
+                    break
+                response, journal_count = item
+                await self.wait_until_durable(journal_count)
+                writer.write(response)
+                if responses.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def wait_until_durable(self, journal_count):
+        # Wait until the first journal_count journal records are on disk
+        if journal_count <= self.durable_count:
+            return
+        self.flush_requested.set()
+        async with self.durable_changed:
+            await self.durable_changed.wait_for(lambda: self.durable_count >= journal_count)
+
+    async def flush_journal(self):
+        # Group commit: one fsync in a worker thread covers every record appended before it started,
+        # while the event loop keeps executing requests whose records go into the next flush
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.flush_requested.wait()
+            self.flush_requested.clear()
+            target = self.journal.written_count
+            await loop.run_in_executor(None, self.journal.sync)
+            self.durable_count = max(self.durable_count, target)
+            async with self.durable_changed:
+                self.durable_changed.notify_all()
+
+    def execute_line(self, line):
+        # Execute one request line and return the encoded response line
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Request must be a JSON object.")
+            request_id = request.get("id")
+            result = self.execute(request)
+            response = {"id": request_id, "ok": True, "result": result}
+        except ValueError:
+            response = {"id": request_id, "ok": False, "error": "Malformed request."}
+        except RequestError as error:
+            response = {"id": request_id, "ok": False, "error": str(error)}
+        except Exception as error:
+            # Answer anyway, so the requests pipelined behind this one on the connection still get their responses
+            print(f"Error executing request {request_id!r}: {error!r}", file=sys.stderr)
+            response = {"id": request_id, "ok": False, "error": "Internal error."}
+        return (json.dumps(response) + "\n").encode()
+
+    def execute(self, request):
+        operation = request.get("op")
+        if operation == "create_account":
+            account_number = self.account_number(request, "account")
+            name = str(request.get("name") or "").strip()
+            if not is_valid_account_holder_name(name):
+                raise RequestError(f"Account holder name must be non-empty, contain no commas and be at most "
+                                   f"{ACCOUNT_NAME_SIZE} bytes long.")
+            initial_cents = self.amount_cents(request, "initial", allow_zero=True)
+            if self.bank.open_account(account_number, name, initial_cents) is None:
+                raise RequestError("Account number already exists.")
+            return {"account": account_number}
+        if operation in ("deposit", "withdraw"):
+            account = self.existing_account(request, "account")
+            amount_cents = self.amount_cents(request, "amount")
+            transaction_type = "deposit" if operation == "deposit" else "withdrawal"
+            if not self.bank.perform_transaction(account.account_number, amount_cents, transaction_type):
+                raise RequestError("Insufficient funds." if transaction_type == "withdrawal" else "Balance limit exceeded.")
+            return {"account": account.account_number, "balance": cents_to_text(account.current_funds_cents)}
+        if operation == "transfer":
+            sender = self.existing_account(request, "account")
+            recipient = self.existing_account(request, "recipient")
+            if recipient is sender:
+                raise RequestError("Cannot transfer to the same account.")
+            amount_cents = self.amount_cents(request, "amount")
+            if not self.bank.transfer_funds(sender.account_number, recipient.account_number, amount_cents):
+                raise RequestError("Insufficient funds." if amount_cents > sender.current_funds_cents
+                                   else "Balance limit exceeded.")
+            return {"account": sender.account_number, "balance": cents_to_text(sender.current_funds_cents)}
+        if operation == "details":
+            account = self.existing_account(request, "account")
+            return {
+                "account": account.account_number,
+                "name": account.account_holder_name,
+                "initial": cents_to_text(account.initial_funds_cents),
+                "balance": cents_to_text(account.current_funds_cents),
+                "deposited": cents_to_text(account.total_deposited_cents),
+                "withdrawn": cents_to_text(account.total_withdrawn_cents),
+            }
+        if operation == "history":
+            account = self.existing_account(request, "account")
+            limit = self.optional_integer(request, "limit", minimum=1)
+            records, cursor = self.bank.query_history(
+                account.account_number, self.optional_integer(request, "start"), self.optional_integer(request, "end"),
+                self.optional_integer(request, "cursor"), HISTORY_PAGE_SIZE if limit is None else limit, newest_first=True)
+            transactions = [{"type": TRANSACTION_TYPE_NAMES[transaction_type].lower(),
+                             "amount": cents_to_text(amount_cents),
+                             "timestamp": timestamp,
+                             "balance": cents_to_text(balance_cents)}
+                            for transaction_type, amount_cents, timestamp, balance_cents in records]
+            return {"transactions": transactions, "cursor": cursor}
+        raise RequestError(f"Unknown operation: {operation}")
+
+    def account_number(self, request, key):
+        account_number = str(request.get(key) or "")
+        if not is_valid_account_number(account_number):
+            raise RequestError("Invalid account number. Account number should be 8 digits.")
+        return account_number
+
+    def optional_integer(self, request, key, minimum=0):
+        value = request.get(key)
+        # JSON true and false arrive as bools, which are ints to Python
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < minimum):
+            raise RequestError(f"{key.capitalize()} must be an integer of at least {minimum}.")
+        return value
+
+    def existing_account(self, request, key):
+        account = self.bank.find_account(self.account_number(request, key))
+        if account is None:
+            raise RequestError(f"Account {request.get(key)} not found.")
+        return account
+
+    def amount_cents(self, request, key, allow_zero=False):
+        amount = request.get(key)
+        if isinstance(amount, bool):
+            raise RequestError("Invalid amount. Amount should be a valid number.")
+        try:
+            amount_cents = to_cents(amount)
+        except (ValueError, TypeError, ArithmeticError):
+            raise RequestError("Invalid amount. Amount should be a valid number.")
+        if amount_cents < 0 or (amount_cents == 0 and not allow_zero):
+            raise RequestError("Invalid amount. Amount should be a positive number.")
+        return amount_cents
+
+def run_server(host, port, demo_accounts=0):
+    # Serve the bank loaded from the data files, or with demo_accounts set, a temporary in-memory bank
+    # of that many accounts journaling to a temporary directory
+    temporary_directory = None
+    if demo_accounts:
+        temporary_directory = tempfile.TemporaryDirectory()
+        bank = build_stress_bank(demo_accounts, 100000000, os.path.join(temporary_directory.name, "journal.log"))
+    else:
+        bank = open_bank()
+    service = BankService(bank)
+    # Stop cleanly on SIGTERM as well as Ctrl+C
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        if bank.journal is not None:
+            with bank.journal.group_commit():  # Syncing is left to the service's background flush
+                asyncio.run(service.serve(host, port))
+        else:
+            asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if temporary_directory is not None:
+            bank.journal.close()
+            temporary_directory.cleanup()
+        else:
+            close_bank(bank)
+
+def make_load_request(generator, request_id, account_numbers):
+    # Build a random request: mostly deposits and withdrawals, with transfers and detail lookups
+    account_number = generator.choice(account_numbers)
+    roll = generator.random()
+    if roll < 0.4:
+        request = {"op": "deposit", "account": account_number, "amount": generator.randint(1, 10000) / 100}
+    elif roll < 0.7:
+        request = {"op": "withdraw", "account": account_number, "amount": generator.randint(1, 10000) / 100}
+    elif roll < 0.9:
+        request = {"op": "transfer", "account": account_number, "recipient": generator.choice(account_numbers),
+                   "amount": generator.randint(1, 10000) / 100}
+    else:
+        request = {"op": "details", "account": account_number}
+    request["id"] = request_id
+    return (json.dumps(request) + "\n").encode()
+
+async def generate_load(host, port, account_numbers, connections, requests_per_connection, pipeline_depth):
+    # Drive the service from several connections, keeping up to pipeline_depth requests in flight on each.
+    # Returns the latency of every request in seconds, the number of successful responses and the elapsed time.
+    latencies = []
+    successes = 0
+
+    async def client(client_index):
+        nonlocal successes
+        reader, writer = await asyncio.open_connection(host, port)
+        generator = random.Random(client_index)
+        send_times = deque()
+        window = asyncio.Semaphore(pipeline_depth)
+
+        async def receive():
+            nonlocal successes
+            for _ in range(requests_per_connection):
+                line = await reader.readline()
+                latencies.append(time.perf_counter() - send_times.popleft())
+                window.release()
+                if json.loads(line).get("ok"):
+                    successes += 1
+
+        receiver = asyncio.create_task(receive())
+        for request_index in range(requests_per_connection):
+            await window.acquire()
+            send_times.append(time.perf_counter())
+            writer.write(make_load_request(generator, request_index, account_numbers))
+            if window.locked():
+                await writer.drain()
+        await writer.drain()
+        await receiver
+        writer.close()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client(index) for index in range(connections)))
+    return latencies, successes, time.perf_counter() - start_time
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def run_load_test(host, port, account_numbers, connections, requests_per_connection, pipeline_depth):
+    # Run the load generator and print throughput and latency percentiles
+    latencies, successes, elapsed = asyncio.run(
+        generate_load(host, port, account_numbers, connections, requests_per_connection, pipeline_depth))
+    latencies.sort()
+    total = len(latencies)
+    print(f"{total} requests over {connections} connections (pipeline depth {pipeline_depth}) in {elapsed:.2f}s")
+    print(f"Throughput: {total / elapsed:,.0f} requests/s ({successes} succeeded)")
+    print(f"Latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms  p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+def wait_for_port(host, port, timeout=10.0):
+    # Wait until a server accepts connections on host:port
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1.0).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+# Service and load generator
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Network service for the Bank Management System.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="serve the bank over TCP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--demo-accounts", type=int, default=0,
+                              help="serve a temporary in-memory bank with this many accounts instead of the data files")
+    bench_parser = commands.add_parser("bench", help="measure latency and throughput against a service")
+    bench_parser.add_argument("--host", default="127.0.0.1")
+    bench_parser.add_argument("--port", type=int, default=None,
+                              help="port of a running service; by default a temporary demo service is started")
+    bench_parser.add_argument("--accounts", type=int, default=1000,
+                              help="use accounts 00000001 up to this number")
+    bench_parser.add_argument("--connections", type=int, default=8)
+    bench_parser.add_argument("--requests", type=int, default=5000, help="requests per connection")
+    bench_parser.add_argument("--pipeline", type=int, default=16, help="requests in flight per connection")
+    arguments = parser.parse_args()
+
+    if arguments.command == "serve":
+        run_server(arguments.host, arguments.port, arguments.demo_accounts)
+    else:
+        account_numbers = [f"{index:08d}" for index in range(1, arguments.accounts + 1)]
+        server_process = None
+        port = arguments.port
+        if port is None:
+            port = DEFAULT_PORT + 1
+            server_process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--host", arguments.host,
+                                               "--port", str(port), "--demo-accounts", str(arguments.accounts)])
+            if not wait_for_port(arguments.host, port):
+                server_process.terminate()
+                sys.exit("The demo service did not start.")
+        try:
+            run_load_test(arguments.host, port, account_numbers, arguments.connections, arguments.requests,
+                          arguments.pipeline)
+        finally:
+            if server_process is not None:
+                server_process.terminate()
+                server_process.wait()
@@ -0,0 +1,197 @@
+import argparse
+from contextlib import redirect_stdout
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import bank_management
+from bank_management import (Account, Bank, get_file_path, load_data_from_file, load_history_file, save_changes_to_file,
+                             save_data_to_file, write_account_data)
+
+# Benchmarks for the hot paths of the bank on synthetic data. Each scale gets its own data directory
+# holding account_data.txt and a "Transaction History" folder, generated deterministically from a seed,
+# so two runs with the same arguments time exactly the same work and their JSON results can be compared.
+
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Frances", "John", "Margaret", "Niklaus"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Allen", "Backus", "Hamilton", "Wirth"]
+START_TIMESTAMP = 1672531200  # 2023-01-01 00:00:00 UTC
+PARAMETERS_FILE_NAME = "benchmark_data.json"
+
+def generate_data(directory, account_count, transactions_per_account, seed=0):
+    # Write account_data.txt and one transaction history file per account into directory. The same
+    # arguments always produce the same files. Accounts are written one at a time, so only their
+    # balances are held in memory.
+    generator = random.Random(seed)
+    bank_management.data_directory = directory
+    accounts = []
+    for index in range(account_count):
+        name = f"{generator.choice(FIRST_NAMES)} {generator.choice(LAST_NAMES)}"
+        account = Account(f"{index + 1:08d}", name, generator.randint(0, 1000000) * 100)
+        timestamp = START_TIMESTAMP + generator.randint(0, 86400)
+        for _ in range(transactions_per_account):
+            timestamp += generator.randint(60, 86400)
+            amount_cents = generator.randint(1, 500000)
+            if generator.random() < 0.4 and amount_cents <= account.current_funds_cents:
+                account.withdraw(amount_cents, timestamp)
+            else:
+                account.deposit(amount_cents, timestamp)
+        account.save_transaction_history()
+        account.set_history_loader(lambda account=account: load_history_file(account))  # Let the history go
+        accounts.append(account)
+    write_account_data(accounts, get_file_path("account_data.txt"))
+
+def prepare_data(directory, account_count, transactions_per_account, seed=0):
+    # Generate the data for one scale into directory unless it already holds data from the same arguments.
+    # Returns the seconds spent generating, or None if existing data was reused.
+    parameters = {"accounts": account_count, "transactions_per_account": transactions_per_account, "seed": seed}
+    parameters_path = os.path.join(directory, PARAMETERS_FILE_NAME)
+    try:
+        with open(parameters_path, "r") as file:
+            if json.load(file) == parameters:
+                return None
+    except (FileNotFoundError, ValueError):
+        pass
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    start_time = time.perf_counter()
+    generate_data(directory, account_count, transactions_per_account, seed)
+    elapsed = time.perf_counter() - start_time
+    with open(parameters_path, "w") as file:
+        json.dump(parameters, file)
+    return elapsed
+
+def timed(operation):
+    # Run operation once, with its printed messages hidden, and return (seconds, its result)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start_time = time.perf_counter()
+        result = operation()
+        elapsed = time.perf_counter() - start_time
+    return elapsed, result
+
+def benchmark_scale(directory, account_count, transactions_per_account, operation_count=10000, seed=0):
+    # Time every benchmarked operation against the data in directory (see prepare_data).
+    # Returns a list of result dicts.
+    bank_management.data_directory = directory
+    data_file_path = get_file_path("account_data.txt")
+    generator = random.Random(seed + 1)
+    results = []
+
+    def record(operation, seconds, count):
+        results.append({"accounts": account_count, "transactions_per_account": transactions_per_account,
+                        "operation": operation, "count": count, "seconds": round(seconds, 6),
+                        "microseconds_per_operation": round(seconds / count * 1e6, 3) if count else None})
+
+    seconds, accounts = timed(lambda: load_data_from_file(data_file_path))
+    record("load_data_from_file", seconds, 1)
+    bank = Bank()
+    bank.load_accounts(accounts)
+    account_numbers = [generator.choice(accounts).account_number for _ in range(operation_count)]
+    sample = [bank.find_account(account_number) for account_number in account_numbers[:min(operation_count, 1000)]]
+
+    def find_accounts():
+        for account_number in account_numbers:
+            bank.find_account(account_number)
+
+    record("find_account", timed(find_accounts)[0], len(account_numbers))
+
+    def load_histories():
+        for account in sample:
+            account.transaction_history
+
+    record("load_transaction_history", timed(load_histories)[0], len(sample))
+
+    amounts = [generator.randint(1, 10000) for _ in range(operation_count)]
+
+    def deposits():
+        for account_number, amount_cents in zip(account_numbers, amounts):
+            bank.perform_transaction(account_number, amount_cents, "deposit")
+
+    def withdrawals():
+        for account_number, amount_cents in zip(account_numbers, amounts):
+            bank.perform_transaction(account_number, amount_cents, "withdrawal")
+
+    # The accounts were chosen at random, so some of these also load a transaction history
+    record("deposit", timed(deposits)[0], len(account_numbers))
+    record("withdraw", timed(withdrawals)[0], len(account_numbers))
+
+    def account_details():
+        for account in sample:
+            account.get_account_details()
+
+    record("get_account_details", timed(account_details)[0], len(sample))
+
+    def reports():
+        for _ in bank.generate_reports():
+            pass
+
+    record("generate_reports", timed(reports)[0], len(bank.accounts))
+
+    # Save into a scratch folder so the generated data stays as it was for the next run: first only the
+    # changed accounts, as a checkpoint does, then everything, as exiting without a journal does
+    save_directory = os.path.join(directory, "saved")
+    shutil.rmtree(save_directory, ignore_errors=True)
+    os.makedirs(os.path.join(save_directory, "Transaction History"))
+    bank_management.data_directory = save_directory
+    save_file_path = get_file_path("account_data.txt")
+    record("save_changes_to_file", timed(lambda: save_changes_to_file(bank, save_file_path))[0], 1)
+    record("save_data_to_file", timed(lambda: save_data_to_file(bank.accounts, save_file_path))[0], 1)
+    shutil.rmtree(save_directory, ignore_errors=True)
+    return results
+
+def compare_results(previous, current):
+    # Print how each operation's time changed against a previous results file
+    previous_times = {(result["accounts"], result["operation"]): result["seconds"] for result in previous["results"]}
+    for result in current["results"]:
+        before = previous_times.get((result["accounts"], result["operation"]))
+        if before:
+            print(f"{result['accounts']:>9} accounts {result['operation']:<26} {before:>10.4f}s -> "
+                  f"{result['seconds']:>10.4f}s ({result['seconds'] / before:.2f}x)")
+
+def run_benchmarks(scales=(1000, 100000, 1000000), transactions_per_account=10, operation_count=10000, seed=0,
+                   directory=None):
+    # Generate (or reuse) the data for each scale and time every operation on it. Returns the results
+    # as a dict ready to be written as JSON.
+    base_directory = directory or os.path.join(tempfile.gettempdir(), "bank_benchmark")
+    output = {"python": platform.python_version(), "platform": platform.platform(), "seed": seed,
+              "transactions_per_account": transactions_per_account, "results": []}
+    try:
+        for account_count in scales:
+            scale_directory = os.path.join(base_directory, f"{account_count}_accounts")
+            generation_seconds = prepare_data(scale_directory, account_count, transactions_per_account, seed)
+            if generation_seconds is not None:
+                print(f"Generated {account_count} accounts x {transactions_per_account} transactions "
+                      f"in {generation_seconds:.1f}s.", file=sys.stderr)
+            for result in benchmark_scale(scale_directory, account_count, transactions_per_account, operation_count, seed):
+                output["results"].append(result)
+                print(f"{account_count:>9} accounts {result['operation']:<26} {result['seconds']:>10.4f}s", file=sys.stderr)
+    finally:
+        bank_management.data_directory = None
+    return output
+
+# Benchmark run
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the bank's hot paths on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 100000, 1000000], help="numbers of accounts")
+    parser.add_argument("--transactions", type=int, default=10, help="transactions per account")
+    parser.add_argument("--operations", type=int, default=10000, help="lookups, deposits and withdrawals per scale")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--directory", default=None, help="where to generate the data (default: a temporary folder)")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", default=None, help="a previous results file to compare against")
+    arguments = parser.parse_args()
+
+    results = run_benchmarks(arguments.scales, arguments.transactions, arguments.operations, arguments.seed,
+                             arguments.directory)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if arguments.compare:
+        with open(arguments.compare, "r") as file:
+            compare_results(json.load(file), results)
@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+import os
+import threading
+import time
+
+# Journal record types
+RECORD_CREATE = "C"
+RECORD_DEPOSIT = "D"
+RECORD_WITHDRAWAL = "W"
+RECORD_TRANSFER = "T"
+
+class Journal:
+    # Append-only journal of account changes made since the last checkpoint.
+    # Each record is one comma-separated line: <type>,<timestamp>,<fields...>
+    #   C,<timestamp>,<account number>,<initial cents>,<account holder name>
+    #   D,<timestamp>,<account number>,<cents>,<history index>
+    #   W,<timestamp>,<account number>,<cents>,<history index>
+    #   T,<timestamp>,<sender>,<recipient>,<cents>,<sender history index>,<recipient history index>
+    # The history index is the position of the transaction in the account's history, which lets
+    # a replay skip transactions that already reached the snapshot before a crash.
+    def __init__(self, file_path, sync_every=1, sync_interval=0.0):
+        self.file_path = file_path
+        self.sync_every = sync_every  # fsync after this many records (group commit)
+        self.sync_interval = sync_interval  # ...or once this many seconds have passed since the last fsync
+        self.lock = threading.Lock()  # Guards writes to the file and the counters below
+        self.sync_lock = threading.Lock()  # Held by the one thread currently running fsync
+        self.record_count = 0  # Records in the journal file
+        self.written_count = 0  # Records appended since the journal was opened
+        self.synced_count = 0  # ...of which are known to be on disk
+        self.last_sync_time = time.monotonic()
+        self.deferred = 0  # Open group_commit blocks; fsyncs wait until the outermost one ends
+        self.file = None
+
+    def open(self):
+        # Open the journal for appending, dropping a partially written last record left by a crash
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        complete_size = 0
+        self.record_count = 0
+        try:
+            with open(self.file_path, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    complete_size += len(line)
+                    self.record_count += 1
+        except FileNotFoundError:
+            pass
+        self.file = open(self.file_path, "a")
+        if self.file.tell() != complete_size:
+            self.file.truncate(complete_size)
+            self.file.seek(complete_size)
+        return self
+
+    def close(self):
+        # Flush outstanding records to disk and close the journal file
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+    def append(self, record_type, *fields):
+        # Append one record, syncing to disk when the group commit batch is full.
+        # When several threads append at once, one fsync covers all of their records (see _sync_to).
+        line = ",".join([record_type] + [str(field) for field in fields]) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.record_count += 1
+            self.written_count += 1
+            sequence = self.written_count
+            if self.deferred:
+                return
+            if (self.written_count - self.synced_count < self.sync_every
+                    and not time.monotonic() - self.last_sync_time >= self.sync_interval > 0):
+                return
+        self._sync_to(sequence)
+
+    @contextmanager
+    def group_commit(self):
+        # Append a group of records with a single fsync at the end instead of one per batch of sync_every
+        with self.lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.deferred -= 1
+                if not self.deferred:
+                    self._sync()
+
+    def sync(self):
+        # Force all appended records to disk
+        with self.lock:
+            sequence = self.written_count
+        self._sync_to(sequence)
+
+    def _sync_to(self, sequence):
+        # Make sure the first sequence records are on disk. Only one thread runs fsync at a time, and it
+        # covers everything written so far, so threads queued behind it usually find their records synced.
+        with self.sync_lock:
+            if self.synced_count >= sequence:
+                return
+            with self.lock:
+                if self.file is None:
+                    return
+                self.file.flush()
+                written = self.written_count
+                file_descriptor = self.file.fileno()
+            os.fsync(file_descriptor)  # Other threads keep appending while the disk flush runs
+            with self.lock:
+                self.synced_count = max(self.synced_count, written)
+                self.last_sync_time = time.monotonic()
+
+    def _sync(self):
+        # Flush and fsync while already holding self.lock
+        if self.file is None:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.synced_count = self.written_count
+        self.last_sync_time = time.monotonic()
+
+    def read_records(self):
+        # Yield every complete record in the journal as (record type, list of fields)
+        try:
+            with open(self.file_path, "r") as file:
+                for line in file:
+                    if not line.endswith("\n"):
+                        break  # Partially written last record
+                    record_type, *fields = line.rstrip("\n").split(",")
+                    if record_type == RECORD_CREATE:
+                        # The account holder name is the last field and is kept whole
+                        fields = fields[:3] + [",".join(fields[3:])]
+                    yield record_type, fields
+        except FileNotFoundError:
+            return
+
+    def truncate(self):
+        # Discard all records once they have been checkpointed into the snapshot
+        with self.lock:
+            self._sync()
+            self.file.truncate(0)
+            self.file.seek(0)
+            self._sync()
+            self.record_count = 0
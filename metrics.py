@@ -0,0 +1,260 @@
+import atexit
+import builtins
+import cProfile
+from functools import wraps
+import inspect
+import json
+import os
+import pstats
+import threading
+import time
+
+# Opt-in instrumentation. Nothing here runs unless it is switched on: instrument() replaces functions and
+# methods with timing wrappers, and count_file_io() shadows open() in a module with one that counts the
+# data passing through its files, so with metrics off the original code runs untouched.
+
+HISTOGRAM_BUCKETS = 28  # Latency buckets are powers of two of microseconds, up to about 2 minutes
+
+class OperationStats:
+    # Call count, error count, latency histogram and file I/O of one instrumented operation
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * (HISTOGRAM_BUCKETS + 1)  # Bucket i counts latencies below 2**i microseconds
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def record(self, elapsed_ns, failed, bytes_read, bytes_written):
+        self.count += 1
+        self.errors += failed
+        self.total_ns += elapsed_ns
+        self.max_ns = max(self.max_ns, elapsed_ns)
+        self.buckets[min((elapsed_ns // 1000).bit_length(), HISTOGRAM_BUCKETS)] += 1
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+
+    def percentile(self, percent):
+        # Upper bound in microseconds of the histogram bucket holding the given percentile
+        rank = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if bucket_count and seen >= rank:
+                return min(2 ** index, self.max_ns / 1000)
+        return 0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_seconds": round(self.total_ns / 1e9, 6),
+            "mean_us": round(self.total_ns / self.count / 1000, 3) if self.count else 0,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": round(self.max_ns / 1000, 3),
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "histogram_us": {f"<{2 ** index}": bucket_count for index, bucket_count in enumerate(self.buckets)
+                             if bucket_count},
+        }
+
+class Metrics:
+    # Registry of OperationStats by operation name, shared by every thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.started = time.time()
+        self.local = threading.local()  # Per-thread stack of [bytes read, bytes written] of running operations
+        self.originals = []  # (owner, name, original) of everything instrumented, to undo it
+
+    def io_stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def pop_io(self, counts):
+        # Remove an operation's counts from this thread's stack. A generator that was not run to the end
+        # may have left its counts above them, so search by identity rather than popping the top.
+        stack = self.io_stack()
+        for index in range(len(stack) - 1, -1, -1):
+            if stack[index] is counts:
+                del stack[index]
+                return
+
+    def count_io(self, bytes_read, bytes_written):
+        # Charge file I/O to every operation running on this thread (operations nest)
+        for counts in self.io_stack():
+            counts[0] += bytes_read
+            counts[1] += bytes_written
+
+    def record(self, name, elapsed_ns, failed, bytes_read, bytes_written):
+        with self.lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.record(elapsed_ns, failed, bytes_read, bytes_written)
+
+    def snapshot(self):
+        # Every operation's summary as a JSON-ready dict
+        with self.lock:
+            operations = {name: stats.summary() for name, stats in sorted(self.operations.items())}
+        return {"time": time.time(), "uptime_seconds": round(time.time() - self.started, 3), "operations": operations}
+
+    def report(self):
+        # Format the summaries as a table, slowest total first
+        lines = [f"{'Operation':<36}{'Count':>10}{'Total s':>10}{'Mean us':>11}{'p50 us':>9}{'p99 us':>9}"
+                 f"{'Read':>12}{'Written':>12}"]
+        operations = self.snapshot()["operations"]
+        for name, summary in sorted(operations.items(), key=lambda item: -item[1]["total_seconds"]):
+            lines.append(f"{name:<36}{summary['count']:>10}{summary['total_seconds']:>10.3f}{summary['mean_us']:>11.1f}"
+                         f"{summary['p50_us']:>9.0f}{summary['p99_us']:>9.0f}{summary['bytes_read']:>12}"
+                         f"{summary['bytes_written']:>12}")
+        return "\n".join(lines)
+
+    def write_json(self, file_path):
+        # Write a snapshot to file_path, replacing it atomically
+        temp_path = file_path + ".tmp"
+        with builtins.open(temp_path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temp_path, file_path)
+
+    def instrument(self, owner, names, prefix=""):
+        # Wrap the named functions of owner (a class, or a module's globals() dict) to record their
+        # latency and I/O under prefix + name. Generator functions are timed until they are exhausted.
+        for name in names:
+            original = owner[name] if isinstance(owner, dict) else owner.__dict__[name]
+            wrapper = self.timed(prefix + name, original)
+            self.originals.append((owner, name, original))
+            if isinstance(owner, dict):
+                owner[name] = wrapper
+            else:
+                setattr(owner, name, wrapper)
+
+    def timed(self, name, function):
+        # Return a wrapper around function that records each call under name
+        metrics = self
+        if inspect.isgeneratorfunction(function):
+            @wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                stack = metrics.io_stack()
+                counts = [0, 0]
+                stack.append(counts)
+                start = time.perf_counter_ns()
+                failed = True
+                try:
+                    yield from function(*args, **kwargs)
+                    failed = False
+                except GeneratorExit:
+                    failed = False  # Closed before the end by a caller that had read all it needed
+                    raise
+                finally:
+                    metrics.pop_io(counts)
+                    metrics.record(name, time.perf_counter_ns() - start, failed, counts[0], counts[1])
+            return generator_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = metrics.io_stack()
+            counts = [0, 0]
+            stack.append(counts)
+            start = time.perf_counter_ns()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                metrics.pop_io(counts)
+                metrics.record(name, time.perf_counter_ns() - start, failed, counts[0], counts[1])
+        return wrapper
+
+    def count_file_io(self, module_globals):
+        # Make open() in a module return files that count what is read from and written to them.
+        # Text files count characters, which is the number of bytes for the single-byte history files.
+        metrics = self
+
+        def counting_open(*args, **kwargs):
+            return CountingFile(builtins.open(*args, **kwargs), metrics)
+
+        self.originals.append((module_globals, "open", module_globals.get("open")))
+        module_globals["open"] = counting_open
+
+    def uninstrument(self):
+        # Put back everything instrument() and count_file_io() replaced
+        for owner, name, original in reversed(self.originals):
+            if isinstance(owner, dict):
+                if original is None:
+                    owner.pop(name, None)
+                else:
+                    owner[name] = original
+            else:
+                setattr(owner, name, original)
+        self.originals = []
+
+    def start_dump_thread(self, file_path, interval):
+        # Write a JSON snapshot to file_path every interval seconds, and once more when the program exits
+        def dump():
+            while True:
+                time.sleep(interval)
+                self.write_json(file_path)
+
+        threading.Thread(target=dump, daemon=True).start()
+        atexit.register(self.write_json, file_path)
+
+class CountingFile:
+    # File wrapper that charges the data passing through it to the running operations (see count_file_io)
+    def __init__(self, file, metrics):
+        self.file = file
+        self.metrics = metrics
+
+    def read(self, *args):
+        data = self.file.read(*args)
+        self.metrics.count_io(len(data), 0)
+        return data
+
+    def readline(self, *args):
+        line = self.file.readline(*args)
+        self.metrics.count_io(len(line), 0)
+        return line
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.file)
+        self.metrics.count_io(len(line), 0)
+        return line
+
+    def write(self, data):
+        self.metrics.count_io(0, len(data))
+        return self.file.write(data)
+
+    def __enter__(self):
+        self.file.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.file.__exit__(*exc_info)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+def start_profiling(file_path=None, top=25):
+    # Profile the rest of the session with cProfile. When the program exits the hottest functions by
+    # cumulative time are printed, and the full profile is saved to file_path for pstats or snakeviz.
+    profiler = cProfile.Profile()
+
+    def finish():
+        profiler.disable()
+        if file_path:
+            profiler.dump_stats(file_path)
+            print(f"Profile saved to {file_path}.")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+    atexit.register(finish)
+    profiler.enable()
+    return profiler
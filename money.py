@@ -0,0 +1,217 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+import locale
+import re
+import sys
+import time
+
+# Money is held everywhere as an int number of cents. These helpers convert to and from
+# that representation at the edges: user input, text files and display.
+CENT = Decimal("0.01")
+MAX_CENTS = 2 ** 63 - 1  # Largest amount the transaction history columns (array "q") can hold
+
+def to_cents(amount):
+    # Convert an amount in currency units (str, int, float or Decimal) to an int number of cents,
+    # rounding half up to the nearest cent. Raises ValueError for anything that is not a finite number
+    # or does not fit in MAX_CENTS.
+    if isinstance(amount, float):
+        amount = repr(amount)  # Use the shortest repr so 0.1 becomes exactly 10 cents
+    try:
+        value = Decimal(amount.strip() if isinstance(amount, str) else amount)
+    except (InvalidOperation, TypeError):
+        raise ValueError(f"Invalid amount: {amount!r}")
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount: {amount!r}")
+    try:
+        cents = int(value.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    except InvalidOperation:
+        raise ValueError(f"Amount out of range: {amount!r}")  # Too many digits to hold in cents
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount out of range: {amount!r}")
+    return cents
+
+def cents_to_decimal(cents):
+    # Convert an int number of cents to an exact Decimal amount in currency units
+    return Decimal(cents).scaleb(-2)
+
+def cents_to_text(cents):
+    # Format cents as a plain decimal string such as "1016000.00", for data files
+    return f"{cents_to_decimal(cents):.2f}"
+
+class CurrencyFormatter:
+    # Formats and parses money with fixed locale conventions (a dict shaped like locale.localeconv()).
+    # The conventions are captured once, so unlike locale.currency nothing reads the locale per call:
+    # the symbol, sign and separators around the number are worked out up front for positive and
+    # negative amounts, and parsing uses a regex compiled for this locale's separators. Results are kept
+    # in an LRU cache because the same amounts come up again and again.
+    def __init__(self, conventions, cache_size=65536):
+        self.conventions = dict(conventions)
+        self.frac_digits = conventions["frac_digits"]
+        if self.frac_digits == locale.CHAR_MAX:
+            # The C locale has no currency conventions (locale.currency refuses to format with it),
+            # so show plain amounts such as "1016000.00"
+            self.frac_digits = 2
+            self.decimal_point, self.thousands_sep, self.grouping = ".", "", []
+            self.affixes = {False: ("", ""), True: ("-", "")}
+        else:
+            self.decimal_point = conventions["mon_decimal_point"] or "."
+            self.thousands_sep = conventions["mon_thousands_sep"]
+            self.grouping = list(conventions["mon_grouping"])
+            self.affixes = {negative: self.sign_and_symbol(negative) for negative in (False, True)}
+        # The common case of groups of three digits can use Python's own thousands grouping
+        self.groups_of_three = self.grouping in ([3, 0], [3, 3, 0]) and bool(self.thousands_sep)
+        self.amount_pattern = re.compile(r"(\d[\d%s]*)(?:%s(\d+))?" % (re.escape(self.thousands_sep), re.escape(self.decimal_point)))
+        self.negative_signs = tuple(sign for sign in ("(", conventions["negative_sign"] or "-") if sign)
+        self.format = lru_cache(maxsize=cache_size)(self.format_uncached)
+        self.parse = lru_cache(maxsize=cache_size)(self.parse_uncached)
+
+    @classmethod
+    def from_locale(cls, cache_size=65536):
+        # Capture the conventions of the current LC_MONETARY locale
+        return cls(locale.localeconv(), cache_size)
+
+    def sign_and_symbol(self, negative):
+        # The text before and after the digits, built the same way as locale.currency builds it
+        conventions = self.conventions
+        prefix = "n_" if negative else "p_"
+        text = "<\0>"
+        symbol = conventions["currency_symbol"]
+        separator = " " if conventions[prefix + "sep_by_space"] else ""
+        if conventions[prefix + "cs_precedes"]:
+            text = symbol + separator + text
+        else:
+            text = text + separator + symbol
+        sign_position = conventions[prefix + "sign_posn"]
+        sign = conventions["negative_sign" if negative else "positive_sign"]
+        if sign_position == 0:
+            text = "(" + text + ")"
+        elif sign_position == 2:
+            text = text + sign
+        elif sign_position == 3:
+            text = text.replace("<", sign)
+        elif sign_position == 4:
+            text = text.replace(">", sign)
+        else:
+            text = sign + text
+        before, after = text.replace("<", "").replace(">", "").split("\0")
+        return before, after
+
+    def group_digits(self, digits):
+        # Insert the thousands separator into a string of digits according to the locale's grouping
+        if self.groups_of_three:
+            return f"{int(digits):,}".replace(",", self.thousands_sep)
+        groups = []
+        size = None
+        for interval in self.grouping:
+            if interval == locale.CHAR_MAX:
+                break
+            if interval == 0:
+                while size and len(digits) > size:
+                    groups.append(digits[-size:])
+                    digits = digits[:-size]
+                break
+            size = interval
+            if len(digits) <= size:
+                break
+            groups.append(digits[-size:])
+            digits = digits[:-size]
+        groups.append(digits)
+        return self.thousands_sep.join(reversed(groups))
+
+    def format_uncached(self, cents):
+        # Format an int number of cents as a currency string
+        negative = cents < 0
+        if self.frac_digits == 2:
+            whole, fraction = divmod(abs(cents), 100)
+            number = self.group_digits(str(whole)) + self.decimal_point + f"{fraction:02d}"
+        else:
+            whole, _, fraction = f"{cents_to_decimal(abs(cents)):.{self.frac_digits}f}".partition(".")
+            number = self.group_digits(whole) + (self.decimal_point + fraction if fraction else "")
+        before, after = self.affixes[negative]
+        return before + number + after
+
+    def parse_uncached(self, text):
+        # Convert a currency string written with these conventions back to cents. Anything around the
+        # number, such as the currency symbol, is ignored. Raises ValueError if there is no number.
+        match = self.amount_pattern.search(text)
+        if match is None:
+            raise ValueError(f"Invalid amount: {text!r}")
+        whole = match.group(1).replace(self.thousands_sep, "") if self.thousands_sep else match.group(1)
+        fraction = match.group(2) or ""
+        if len(fraction) > 2:
+            cents = to_cents(whole + "." + fraction)
+        else:
+            cents = int(whole) * 100 + int((fraction + "00")[:2])
+        around = text[:match.start()] + text[match.end():]
+        if any(sign in around for sign in self.negative_signs):
+            cents = -cents
+        return cents
+
+# Transaction history files are always written with these conventions and this encoding, whatever the
+# user's locale, so they read back the same everywhere. They match the files the system has always
+# shipped with: pounds sterling, with the '£' symbol stored as the single Windows-1252 byte 0xA3.
+FILE_ENCODING = "cp1252"
+FILE_CONVENTIONS = {
+    "currency_symbol": "£", "mon_decimal_point": ".", "mon_thousands_sep": ",", "mon_grouping": [3, 3, 0],
+    "positive_sign": "", "negative_sign": "-", "frac_digits": 2, "p_cs_precedes": 1, "p_sep_by_space": 0,
+    "n_cs_precedes": 1, "n_sep_by_space": 0, "p_sign_posn": 1, "n_sign_posn": 1,
+}
+file_formatter = CurrencyFormatter(FILE_CONVENTIONS)
+display_formatter = None  # Captured from the user's locale on first use, see capture_locale
+
+def capture_locale():
+    # Capture the current locale's currency conventions for display. Call again after changing the locale.
+    global display_formatter
+    display_formatter = CurrencyFormatter.from_locale()
+    return display_formatter
+
+def format_money(cents):
+    # Format cents as a currency string using the user's locale, for display
+    return (display_formatter or capture_locale()).format(cents)
+
+def parse_money(text):
+    # Convert a currency string in the user's locale back to cents
+    return (display_formatter or capture_locale()).parse(text)
+
+def format_file_money(cents):
+    # Format cents as a currency string for a transaction history file
+    return file_formatter.format(cents)
+
+def parse_file_money(text):
+    # Convert a currency string from a transaction history file back to cents
+    return file_formatter.parse(text)
+
+def benchmark_formatting(count=1000000):
+    # Compare locale.currency with a CurrencyFormatter for the current locale over count amounts, both for
+    # distinct amounts (every call misses the cache) and for amounts that repeat.
+    # Returns a dict of seconds taken by each.
+    amounts = [cents * 7919 % 100000000 for cents in range(count)]
+    repeated = [cents % 1000 * 100 for cents in range(count)]
+    results = {}
+    start = time.perf_counter()
+    for cents in amounts:
+        locale.currency(cents_to_decimal(cents), grouping=True, symbol=True)
+    results["locale.currency"] = time.perf_counter() - start
+    formatter = CurrencyFormatter.from_locale()
+    start = time.perf_counter()
+    for cents in amounts:
+        formatter.format_uncached(cents)
+    results["formatter, distinct amounts"] = time.perf_counter() - start
+    start = time.perf_counter()
+    for cents in repeated:
+        formatter.format(cents)
+    results["formatter, repeated amounts"] = time.perf_counter() - start
+    return results
+
+# Formatting benchmark
+if __name__ == "__main__":
+    locale.setlocale(locale.LC_ALL, "")
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    try:
+        results = benchmark_formatting(count)
+    except ValueError as error:
+        print(f"{error} Run the benchmark with a locale that has a currency, such as LC_ALL=en_GB.UTF-8.")
+        sys.exit(1)
+    baseline = results["locale.currency"]
+    for name, seconds in results.items():
+        print(f"{name:<28} {count:,} formats in {seconds:.2f}s ({baseline / seconds:.1f}x)")
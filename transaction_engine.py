@@ -0,0 +1,239 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import random
+import tempfile
+import threading
+import time
+
+from bank_management import Account, Bank, replay_journal
+from journal import Journal
+
+class SharedExclusiveLock:
+    # Lock that any number of threads can hold in shared mode, or a single thread in exclusive mode.
+    # Waiting exclusive holders block new shared holders so a checkpoint cannot be starved.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.shared_holders = 0
+        self.exclusive_held = False
+        self.exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self.condition:
+            while self.exclusive_held or self.exclusive_waiting:
+                self.condition.wait()
+            self.shared_holders += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.shared_holders -= 1
+                if not self.shared_holders:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            self.exclusive_waiting += 1
+            while self.exclusive_held or self.shared_holders:
+                self.condition.wait()
+            self.exclusive_waiting -= 1
+            self.exclusive_held = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.exclusive_held = False
+                self.condition.notify_all()
+
+class TransactionEngine:
+    # Thread-safe front end to a Bank for many concurrent clients.
+    # Every operation holds the locks of the accounts it touches, acquired in account number order so
+    # that two operations over the same accounts can never deadlock. A transfer checks the sender's
+    # funds and applies both legs and its journal record while holding both locks, so other threads
+    # see either both legs or neither. Checkpoints run with every operation paused.
+    def __init__(self, bank):
+        self.bank = bank
+        self.account_locks = {}  # Account number -> Lock, created on first use
+        self.registry_lock = threading.Lock()  # Guards account_locks and account creation
+        self.gate = SharedExclusiveLock()  # Operations hold it shared, checkpoints exclusive
+        self.checkpoint_lock = threading.Lock()
+        # The bank would otherwise checkpoint from inside an operation while other threads are running
+        self.checkpoint_every = bank.checkpoint_every
+        bank.checkpoint_every = 0
+
+    def lock_for(self, account_number):
+        # Get the lock for an account, creating it on first use
+        lock = self.account_locks.get(account_number)
+        if lock is None:
+            with self.registry_lock:
+                lock = self.account_locks.setdefault(account_number, threading.Lock())
+        return lock
+
+    @contextmanager
+    def locked(self, *account_numbers):
+        # Hold the locks of the given accounts for the duration of an operation
+        locks = [self.lock_for(account_number) for account_number in sorted(set(account_numbers))]
+        with self.gate.shared():
+            for lock in locks:
+                lock.acquire()
+            try:
+                yield
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    def create_account(self, account_number, account_holder_name, initial_balance_cents):
+        # Create an account, returning None if the account number is already taken
+        with self.gate.shared(), self.registry_lock:
+            account = self.bank.open_account(account_number, account_holder_name, initial_balance_cents)
+        self.maybe_checkpoint()
+        return account
+
+    def deposit(self, account_number, amount_cents):
+        # Deposit into an account; returns False if the account does not exist or the amount is invalid
+        return self.post(account_number, amount_cents, "deposit")
+
+    def withdraw(self, account_number, amount_cents):
+        # Withdraw from an account; returns False if it does not exist or has insufficient funds
+        return self.post(account_number, amount_cents, "withdrawal")
+
+    def post(self, account_number, amount_cents, transaction_type):
+        account = self.bank.find_account(account_number)
+        if account is None:
+            return False
+        with self.locked(account_number):
+            posted = self.bank.post_transaction(account, amount_cents, transaction_type, int(time.time()))
+        self.maybe_checkpoint()
+        return posted
+
+    def transfer(self, sender_account_number, recipient_account_number, amount_cents):
+        # Atomically move funds between two accounts; returns False if nothing was transferred
+        with self.locked(sender_account_number, recipient_account_number):
+            transferred = self.bank.transfer_funds(sender_account_number, recipient_account_number, amount_cents)
+        self.maybe_checkpoint()
+        return transferred
+
+    def balance(self, account_number):
+        # Current balance of an account in cents, or None if it does not exist
+        account = self.bank.find_account(account_number)
+        if account is None:
+            return None
+        with self.locked(account_number):
+            return account.current_funds_cents
+
+    def account_details(self, account_number):
+        # Formatted account details, or None if the account does not exist
+        account = self.bank.find_account(account_number)
+        if account is None:
+            return None
+        with self.locked(account_number):
+            return account.get_account_details()
+
+    def transaction_history(self, account_number):
+        # Formatted transaction history lines, or None if the account does not exist
+        account = self.bank.find_account(account_number)
+        if account is None:
+            return None
+        with self.locked(account_number):
+            return list(account.transaction_history.formatted())
+
+    def checkpoint(self):
+        # Checkpoint the journal into the snapshot while no operation is running
+        with self.gate.exclusive():
+            return self.bank.checkpoint()
+
+    def maybe_checkpoint(self):
+        # Checkpoint once the journal has grown past the bank's checkpoint interval
+        journal = self.bank.journal
+        if not self.checkpoint_every or journal is None or journal.record_count < self.checkpoint_every:
+            return
+        if self.checkpoint_lock.acquire(blocking=False):  # One thread checkpoints, the others carry on
+            try:
+                if journal.record_count >= self.checkpoint_every:
+                    self.checkpoint()
+            finally:
+                self.checkpoint_lock.release()
+
+def build_stress_bank(account_count, initial_balance_cents, journal_path=None, sync_every=1):
+    # Create an in-memory bank of numbered accounts, journaling to journal_path if given
+    bank = Bank()
+    for index in range(account_count):
+        bank.add_account(Account(f"{index + 1:08d}", f"Stress Account {index + 1}", initial_balance_cents))
+    if journal_path is not None:
+        bank.attach_journal(Journal(journal_path, sync_every=sync_every), None, checkpoint_every=0)
+    return bank
+
+def run_stress_test(pair_counts=(1, 2, 4, 8, 16), transfers_per_pair=2000, use_journal=True, sync_every=1):
+    # Measure transfer throughput with one thread per disjoint pair of accounts, for each pair count,
+    # then run every thread against a small shared set of accounts to check for deadlocks and that
+    # money is conserved and the journal replays to the same balances.
+    # Returns a list of (pair count, transfers per second).
+    initial_balance_cents = 1000000
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for pair_count in pair_counts:
+            journal_path = os.path.join(directory, f"stress_{pair_count}.log") if use_journal else None
+            bank = build_stress_bank(pair_count * 2, initial_balance_cents, journal_path, sync_every)
+            engine = TransactionEngine(bank)
+
+            def transfer_back_and_forth(pair):
+                first, second = f"{pair * 2 + 1:08d}", f"{pair * 2 + 2:08d}"
+                for index in range(transfers_per_pair):
+                    if index % 2:
+                        engine.transfer(second, first, 100)
+                    else:
+                        engine.transfer(first, second, 100)
+
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=pair_count) as pool:
+                list(pool.map(transfer_back_and_forth, range(pair_count)))
+            elapsed = time.perf_counter() - start_time
+            if bank.journal is not None:
+                bank.journal.close()
+            rate = pair_count * transfers_per_pair / elapsed
+            results.append((pair_count, rate))
+            print(f"{pair_count:>4} disjoint pairs: {rate:>12,.0f} transfers/s")
+
+        # Contended run: every thread transfers at random between the same few accounts
+        thread_count = max(pair_counts)
+        account_count = 4
+        journal_path = os.path.join(directory, "stress_contended.log")
+        bank = build_stress_bank(account_count, initial_balance_cents, journal_path, sync_every)
+        engine = TransactionEngine(bank)
+        account_numbers = [account.account_number for account in bank.accounts]
+
+        def transfer_at_random(seed):
+            generator = random.Random(seed)
+            for _ in range(transfers_per_pair):
+                sender, recipient = generator.sample(account_numbers, 2)
+                engine.transfer(sender, recipient, generator.randint(1, 5000))
+
+        with ThreadPoolExecutor(max_workers=thread_count) as pool:
+            list(pool.map(transfer_at_random, range(thread_count)))
+        bank.journal.close()
+
+        balances = {account.account_number: account.current_funds_cents for account in bank.accounts}
+        conserved = sum(balances.values()) == account_count * initial_balance_cents
+        non_negative = all(balance >= 0 for balance in balances.values())
+        replayed_bank = build_stress_bank(account_count, initial_balance_cents)
+        replay_journal(replayed_bank, Journal(journal_path))
+        replay_matches = all(account.current_funds_cents == balances[account.account_number]
+                             for account in replayed_bank.accounts)
+        print(f"Contended run with {thread_count} threads: money conserved: {conserved}, "
+              f"no negative balances: {non_negative}, journal replay matches: {replay_matches}")
+    return results
+
+# Stress test
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stress test the concurrent transaction engine.")
+    parser.add_argument("--pairs", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="numbers of disjoint account pairs (one thread each) to measure")
+    parser.add_argument("--transfers", type=int, default=2000, help="transfers per thread")
+    parser.add_argument("--no-journal", action="store_true",
+                        help="keep everything in memory; throughput is then bound by the interpreter lock")
+    parser.add_argument("--sync-every", type=int, default=1, help="journal records per fsync")
+    arguments = parser.parse_args()
+    run_stress_test(arguments.pairs, arguments.transfers, not arguments.no_journal, arguments.sync_every)